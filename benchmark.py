@@ -0,0 +1,236 @@
+"""
+Benchmark script for the analysis and download engine
+Run this script with: python benchmark.py <benchmark> [options]
+
+Benchmarks:
+    backends URL [URL ...]   Compare the subprocess and in-process extraction backends
+    lean URL [URL ...]       Compare bytes and parse time of full -J output and lean analysis output
+    fragments                Download throughput of an HLS stream from a local test server
+                             for several --concurrent-fragments values (and aria2c if installed)
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from downloader_core import (
+    InProcessExtractor, SubprocessExtractor, LEAN_PRINT_TEMPLATE, lean_info, parse_lean_line,
+    get_download_engine_args, get_ytdlp_command
+)
+
+
+def time_extractions(extractor, urls, repeat):
+    """Extract every URL `repeat` times and return per-URL timings in seconds"""
+    timings = []
+    for _ in range(repeat):
+        for url in urls:
+            start = time.perf_counter()
+            try:
+                extractor.extract(url, timeout=60)
+            except Exception as e:
+                print(f"  ✗ {url}: {e}")
+                continue
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def print_timings(name, timings):
+    if not timings:
+        print(f"{name:<12} no successful extractions")
+        return
+    print(f"{name:<12} n={len(timings):<4} total={sum(timings):7.2f}s  "
+          f"mean={statistics.mean(timings):6.3f}s  "
+          f"median={statistics.median(timings):6.3f}s  "
+          f"min={min(timings):6.3f}s")
+
+
+def bench_backends(args):
+    """Compare subprocess and in-process extraction on the same URLs"""
+    backends = [SubprocessExtractor(get_ytdlp_command())]
+    if InProcessExtractor.is_available():
+        backends.append(InProcessExtractor())
+    else:
+        print("yt_dlp module not importable - only the subprocess backend is measured")
+
+    for extractor in backends:
+        # Warm up once so the in-process import cost is reported separately
+        start = time.perf_counter()
+        version = extractor.version()
+        print(f"{extractor.name}: yt-dlp {version} (first call {time.perf_counter() - start:.3f}s)")
+
+    print()
+    for extractor in backends:
+        print_timings(extractor.name, time_extractions(extractor, args.urls, args.repeat))
+
+
+def bench_lean(args):
+    """Measure output size and parse time per video for full and lean analysis"""
+    modes = [
+        ("full -J", ["-J"], json.loads),
+        ("lean -O", ["-O", LEAN_PRINT_TEMPLATE], parse_lean_line),
+    ]
+    results = {name: {"bytes": [], "parse": [], "wall": []} for name, _, _ in modes}
+
+    for url in args.urls:
+        for name, output_args, parse in modes:
+            cmd = get_ytdlp_command() + output_args + ["--no-playlist", url]
+            start = time.perf_counter()
+            result = subprocess.run(cmd, capture_output=True, timeout=120)
+            wall = time.perf_counter() - start
+            if result.returncode != 0:
+                print(f"  ✗ {name} {url}: {result.stderr.decode(errors='replace').strip()[:100]}")
+                continue
+
+            text = result.stdout.decode("utf-8")
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                parse(text)
+            parse_time = (time.perf_counter() - start) / args.repeat
+
+            results[name]["bytes"].append(len(result.stdout))
+            results[name]["parse"].append(parse_time)
+            results[name]["wall"].append(wall)
+
+    print(f"{'mode':<10} {'bytes/video':>12} {'parse ms/video':>15} {'wall s/video':>13}")
+    for name, values in results.items():
+        if not values["bytes"]:
+            continue
+        print(f"{name:<10} {statistics.mean(values['bytes']):12.0f} "
+              f"{statistics.mean(values['parse']) * 1000:15.3f} "
+              f"{statistics.mean(values['wall']):13.3f}")
+
+    # In-process: size of what gets kept in memory / cached for each record
+    if InProcessExtractor.is_available():
+        extractor = InProcessExtractor()
+        full_sizes, lean_sizes = [], []
+        for url in args.urls:
+            try:
+                info = extractor.extract(url, timeout=60)
+            except Exception as e:
+                print(f"  ✗ inprocess {url}: {e}")
+                continue
+            full_sizes.append(len(json.dumps(info)))
+            lean_sizes.append(len(json.dumps(lean_info(info))))
+        if full_sizes:
+            print()
+            print(f"in-process record size: full {statistics.mean(full_sizes):.0f} B, "
+                  f"lean {statistics.mean(lean_sizes):.0f} B per video")
+
+
+def start_hls_server(segments, segment_size, latency, rate):
+    """Serve an HLS playlist of random segments; every segment request waits latency seconds
+    and is sent at most rate bytes/s, like a CDN that throttles each connection"""
+    payload = os.urandom(segment_size)
+    playlist = "#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:2\n#EXT-X-MEDIA-SEQUENCE:0\n"
+    playlist += "".join(f"#EXTINF:2.0,\nseg{i}.ts\n" for i in range(segments))
+    playlist += "#EXT-X-ENDLIST\n"
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.endswith(".m3u8"):
+                body, content_type = playlist.encode(), "application/vnd.apple.mpegurl"
+            else:
+                time.sleep(latency)
+                body, content_type = payload, "video/mp2t"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+
+            chunk = 16 * 1024
+            for offset in range(0, len(body), chunk):
+                self.wfile.write(body[offset:offset + chunk])
+                if rate:
+                    time.sleep(chunk / rate)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def bench_fragments(args):
+    """Compare download throughput for several fragment concurrency settings"""
+    server = start_hls_server(args.segments, args.segment_kb * 1024, args.latency_ms / 1000, args.rate_kb * 1024)
+    url = f"http://127.0.0.1:{server.server_address[1]}/stream.m3u8"
+    total_bytes = args.segments * args.segment_kb * 1024
+    print(f"Test stream: {args.segments} segments x {args.segment_kb} KiB, "
+          f"{args.latency_ms} ms latency, {args.rate_kb or 'unlimited'} KiB/s per connection")
+    print()
+
+    configs = [(f"-N {n}", get_download_engine_args(n)) for n in args.fragments]
+    if shutil.which("aria2c"):
+        configs.append(("aria2c", get_download_engine_args(1, "", "aria2c", "-x 8 -s 8 -k 1M")))
+    else:
+        print("aria2c not found - external downloader not measured")
+
+    print(f"{'engine':<10} {'wall s':>8} {'MiB/s':>8} {'speedup':>8}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name, engine_args in configs:
+            timings = []
+            for run in range(args.repeat):
+                cmd = get_ytdlp_command() + [url, "-o", os.path.join(out_dir, f"{run}.%(ext)s"),
+                                             "--force-overwrites", "--no-part", "--quiet"] + engine_args
+                start = time.perf_counter()
+                result = subprocess.run(cmd, capture_output=True, text=True)
+                if result.returncode != 0:
+                    print(f"  ✗ {name}: {result.stderr.strip()[-200:]}")
+                    break
+                timings.append(time.perf_counter() - start)
+            if not timings:
+                continue
+            wall = statistics.median(timings)
+            baseline = baseline or wall
+            print(f"{name:<10} {wall:8.2f} {total_bytes / wall / 2 ** 20:8.2f} {baseline / wall:7.2f}x")
+
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IB YouTube Downloader - Benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    backends_parser = subparsers.add_parser("backends", help="Compare extraction backends")
+    backends_parser.add_argument("urls", nargs="+", help="URLs to analyze")
+    backends_parser.add_argument("--repeat", type=int, default=1, help="Number of passes over the URLs")
+    backends_parser.set_defaults(func=bench_backends)
+
+    lean_parser = subparsers.add_parser("lean", help="Compare full and lean analysis output")
+    lean_parser.add_argument("urls", nargs="+", help="URLs to analyze")
+    lean_parser.add_argument("--repeat", type=int, default=20, help="Parse repetitions per video")
+    lean_parser.set_defaults(func=bench_lean)
+
+    fragments_parser = subparsers.add_parser("fragments", help="Compare fragment concurrency on a local HLS server")
+    fragments_parser.add_argument("--fragments", type=int, nargs="+", default=[1, 4, 8, 16],
+                                  help="--concurrent-fragments values to measure")
+    fragments_parser.add_argument("--segments", type=int, default=60, help="Number of HLS segments")
+    fragments_parser.add_argument("--segment-kb", type=int, default=256, help="Segment size in KiB")
+    fragments_parser.add_argument("--latency-ms", type=int, default=100, help="Delay before each segment response")
+    fragments_parser.add_argument("--rate-kb", type=int, default=4096, help="Per-connection rate limit in KiB/s (0 = none)")
+    fragments_parser.add_argument("--repeat", type=int, default=1, help="Runs per setting (median is reported)")
+    fragments_parser.set_defaults(func=bench_fragments)
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"IB YouTube Downloader - Benchmark: {args.benchmark}")
+    print("=" * 60)
+    print()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
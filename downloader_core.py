@@ -0,0 +1,2948 @@
+"""
+Download engine of IB YouTube Downloader - analysis, download queue and yt-dlp command building
+without any GUI dependency. Used by youtube_downloader.py and by the headless command line mode:
+
+    python youtube_downloader.py --headless urls.txt --quality 1080 --types video subtitle
+"""
+import argparse
+import codecs
+import gzip
+import hashlib
+import hmac
+import importlib.util
+import json
+import locale
+import logging
+import os
+import queue
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from urllib.request import urlopen
+
+
+class AnalysisError(Exception):
+    """Raised when a single URL could not be analyzed"""
+
+
+class AnalysisCancelled(AnalysisError):
+    """Raised when an analysis run was cancelled because its URLs are no longer current"""
+
+
+class CancelToken:
+    """Cancellation flag shared by one analysis run and the yt-dlp processes it starts.
+
+    Backends register their processes while they run so cancel() can kill
+    them; work that has not started yet checks the token and is skipped.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        self.skipped = 0  # URLs that were never analyzed because of the cancel
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel the run and kill its running yt-dlp processes, returning how many were killed"""
+        with self._lock:
+            self._event.set()
+            processes = list(self._processes)
+            self._processes.clear()
+
+        killed = 0
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                killed += 1
+        return killed
+
+    def register(self, process):
+        """Track a running process; it is killed right away if the run is already cancelled"""
+        with self._lock:
+            if not self._event.is_set():
+                self._processes.add(process)
+                return
+        process.kill()
+
+    def unregister(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def check(self, count=1):
+        """Raise AnalysisCancelled (counting count URLs as skipped) if the run was cancelled"""
+        if self._event.is_set():
+            with self._lock:
+                self.skipped += count
+            raise AnalysisCancelled("Analysis cancelled")
+
+
+class SubprocessExtractor:
+    """Extraction backend that spawns a yt-dlp process for every URL"""
+
+    name = "subprocess"
+
+    def __init__(self, command, lean=False):
+        self.command = list(command)
+        self.lean = lean
+
+    def _output_args(self, single):
+        """Arguments selecting full JSON (-J/-j) or the lean print template"""
+        if self.lean:
+            return ["-O", LEAN_PRINT_TEMPLATE]
+        return ["-J"] if single else ["-j"]
+
+    def _parse_output(self, text):
+        """Parse one video's output as produced by _output_args"""
+        return parse_lean_line(text) if self.lean else json.loads(text)
+
+    def version(self):
+        """Return the yt-dlp version, or None if yt-dlp cannot be run"""
+        try:
+            result = subprocess.run(
+                self.command + ["--version"],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
+            return result.stdout.strip() if result.returncode == 0 else None
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            return None
+
+    def _run(self, cmd, timeout, cancel_token=None):
+        """Run yt-dlp to completion, killing it on timeout or when cancel_token is cancelled"""
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace"
+        )
+        if cancel_token is not None:
+            cancel_token.register(process)
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        finally:
+            if cancel_token is not None:
+                cancel_token.unregister(process)
+
+        if cancel_token is not None and cancel_token.cancelled:
+            raise AnalysisCancelled("Analysis cancelled")
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+    def extract(self, url, cookies_from_browser=None, timeout=30, cancel_token=None):
+        """Return the full info dict for url (equivalent to yt-dlp -J)"""
+        cmd = self.command + self._output_args(single=True) + ["--no-playlist"]
+        if cookies_from_browser:
+            cmd.extend(["--cookies-from-browser", cookies_from_browser])
+        cmd.extend(["--", url])
+
+        try:
+            result = self._run(cmd, timeout, cancel_token)
+        except subprocess.TimeoutExpired:
+            raise AnalysisError("Analysis timeout")
+
+        if result.returncode != 0:
+            raise AnalysisError(result.stderr.strip() or "yt-dlp exited with an error")
+
+        try:
+            return self._parse_output(result.stdout)
+        except json.JSONDecodeError:
+            raise AnalysisError("Failed to parse video information")
+
+
+    def extract_flat(self, url, cookies_from_browser=None, timeout=120, cancel_token=None):
+        """Return a playlist/channel with lightweight entries (yt-dlp -J --flat-playlist)"""
+        cmd = self.command + ["-J", "--flat-playlist", "--yes-playlist"]
+        if cookies_from_browser:
+            cmd.extend(["--cookies-from-browser", cookies_from_browser])
+        cmd.extend(["--", url])
+
+        try:
+            result = self._run(cmd, timeout, cancel_token)
+        except subprocess.TimeoutExpired:
+            raise AnalysisError("Playlist expansion timeout")
+
+        if result.returncode != 0:
+            raise AnalysisError(result.stderr.strip() or "yt-dlp exited with an error")
+
+        try:
+            return json.loads(result.stdout)
+        except json.JSONDecodeError:
+            raise AnalysisError("Failed to parse playlist information")
+
+    def extract_many(self, urls, on_info, on_error, cookies_from_browser=None, timeout=30, cancel_token=None):
+        """Extract several URLs with one yt-dlp process, streaming each JSON line as it arrives.
+
+        yt-dlp reads the URLs from --batch-file and prints one -j line per
+        video, so extractor setup and HTTP connections are shared across the
+        batch. --ignore-errors keeps going after a failed URL. If yt-dlp stalls
+        for longer than timeout seconds, the URL it was working on is failed
+        and the process is restarted for the remaining ones.
+        """
+        remaining = list(urls)
+        while remaining:
+            remaining = self._extract_batch(remaining, on_info, on_error, cookies_from_browser, timeout, cancel_token)
+
+    def _extract_batch(self, urls, on_info, on_error, cookies_from_browser, timeout, cancel_token=None):
+        """Run one batched yt-dlp process and return the URLs left over after a stall"""
+        cmd = self.command + self._output_args(single=False) + ["--no-playlist", "--ignore-errors", "--batch-file", "-"]
+        if cookies_from_browser:
+            cmd.extend(["--cookies-from-browser", cookies_from_browser])
+
+        unresolved = OrderedDict((url, get_video_key(url)) for url in urls)
+        unmatched_errors = []
+        lock = threading.Lock()
+        last_activity = [time.monotonic()]
+
+        def resolve(url, info=None, error=None):
+            with lock:
+                if unresolved.pop(url, None) is None:
+                    return
+            if error is None:
+                on_info(url, info)
+            else:
+                on_error(url, error)
+
+        def match_url(info):
+            """Find the requested URL a -j line belongs to"""
+            original = info.get("original_url")
+            if original in unresolved:
+                return original
+            extractor = (info.get("extractor_key") or "").lower()
+            candidates = {f"{extractor} {info.get('id')}"}
+            if info.get("webpage_url"):
+                candidates.add(get_video_key(info["webpage_url"]))
+            for url, key in list(unresolved.items()):
+                if key in candidates:
+                    return url
+            return None
+
+        def read_errors(stream):
+            """Fail URLs as soon as yt-dlp reports an error for their video ID"""
+            for line in stream:
+                last_activity[0] = time.monotonic()
+                match = re.match(r"ERROR: \[[^\]]+\] ([^:\s]+): (.*)", line.strip())
+                if not match:
+                    continue
+                video_id, message = match.groups()
+                for url, key in list(unresolved.items()):
+                    if key.split(" ", 1)[1] == video_id:
+                        resolve(url, error=AnalysisError(message))
+                        break
+                else:
+                    unmatched_errors.append(message)
+
+        try:
+            process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+                errors="replace"
+            )
+        except FileNotFoundError as e:
+            for url in urls:
+                on_error(url, AnalysisError(str(e)))
+            return []
+
+        if cancel_token is not None:
+            cancel_token.register(process)
+
+        process.stdin.write("\n".join(urls) + "\n")
+        process.stdin.close()
+
+        stderr_thread = threading.Thread(target=read_errors, args=(process.stderr,))
+        stderr_thread.daemon = True
+        stderr_thread.start()
+
+        stalled = [False]
+
+        def watchdog():
+            """Kill yt-dlp if it produces no output for timeout seconds"""
+            while process.poll() is None:
+                if time.monotonic() - last_activity[0] > timeout:
+                    stalled[0] = True
+                    process.kill()
+                    return
+                time.sleep(0.5)
+
+        watchdog_thread = threading.Thread(target=watchdog)
+        watchdog_thread.daemon = True
+        watchdog_thread.start()
+
+        for line in process.stdout:
+            last_activity[0] = time.monotonic()
+            line = line.strip()
+            if not line.startswith("{"):
+                continue
+            try:
+                info = self._parse_output(line)
+            except json.JSONDecodeError:
+                continue
+            url = match_url(info)
+            if url is not None:
+                resolve(url, info=info)
+
+        process.wait()
+        stderr_thread.join(timeout=5)
+        if cancel_token is not None:
+            cancel_token.unregister(process)
+
+        leftover = list(unresolved)
+        if cancel_token is not None and cancel_token.cancelled:
+            for url in leftover:
+                resolve(url, error=AnalysisCancelled("Analysis cancelled"))
+            return []
+
+        if stalled[0] and leftover:
+            # yt-dlp works through the batch file in order - the first unresolved URL is the one that hung
+            resolve(leftover[0], error=AnalysisError("Analysis timeout"))
+            return leftover[1:]
+
+        # Errors arrive in batch order, so if every leftover URL has one they line up
+        if len(unmatched_errors) != len(leftover):
+            unmatched_errors = ["yt-dlp returned no information for this URL"] * len(leftover)
+        for url, message in zip(leftover, unmatched_errors):
+            resolve(url, error=AnalysisError(message))
+        return []
+
+
+class InProcessExtractor:
+    """Extraction backend that calls the yt_dlp Python API in this process.
+
+    yt_dlp is imported once, and YoutubeDL instances are kept alive per
+    cookie/option profile so extractor setup and HTTP connections are reused.
+    A YoutubeDL instance is not thread-safe, so each profile keeps a small
+    pool of idle instances that worker threads check out and return.
+    """
+
+    name = "inprocess"
+
+    class _Logger:
+        """Swallow yt-dlp console output - errors are raised as exceptions"""
+
+        def debug(self, msg):
+            pass
+
+        def info(self, msg):
+            pass
+
+        def warning(self, msg):
+            pass
+
+        def error(self, msg):
+            pass
+
+    def __init__(self, lean=False):
+        self.lean = lean
+        self._module = None
+        self._idle = {}  # profile -> [YoutubeDL, ...]
+        self._lock = threading.Lock()
+
+    def _finish(self, ydl, info):
+        """Turn a raw info dict into the JSON-compatible result (lean or full)"""
+        return lean_info(info) if self.lean else ydl.sanitize_info(info)
+
+    @staticmethod
+    def is_available():
+        """Check whether the yt_dlp module is installed (without importing it - that happens on first use)"""
+        return importlib.util.find_spec("yt_dlp") is not None
+
+    def _get_module(self):
+        """Import yt_dlp on first use"""
+        if self._module is None:
+            import yt_dlp
+            self._module = yt_dlp
+        return self._module
+
+    def version(self):
+        """Return the yt_dlp module version, or None if it is not installed"""
+        try:
+            return self._get_module().version.__version__
+        except ImportError:
+            return None
+
+    def _acquire(self, profile):
+        """Check out an idle YoutubeDL instance for profile, creating one if needed"""
+        with self._lock:
+            idle = self._idle.setdefault(profile, [])
+            if idle:
+                return idle.pop()
+
+        cookies_from_browser, timeout, flat = profile
+        params = {
+            "quiet": True,
+            "no_warnings": True,
+            "noprogress": True,
+            "noplaylist": not flat,
+            "skip_download": True,
+            "socket_timeout": timeout,
+            "logger": self._Logger(),
+        }
+        if flat:
+            params["extract_flat"] = "in_playlist"
+        if cookies_from_browser:
+            browser, _, browser_profile = cookies_from_browser.partition(":")
+            params["cookiesfrombrowser"] = (browser, browser_profile or None, None, None)
+
+        return self._get_module().YoutubeDL(params)
+
+    def _release(self, profile, ydl):
+        """Return a YoutubeDL instance to the idle pool"""
+        with self._lock:
+            self._idle.setdefault(profile, []).append(ydl)
+
+    def extract(self, url, cookies_from_browser=None, timeout=30, cancel_token=None):
+        """Return the full info dict for url without spawning a process"""
+        if cancel_token is not None and cancel_token.cancelled:
+            raise AnalysisCancelled("Analysis cancelled")
+        profile = (cookies_from_browser, timeout, False)
+        ydl = self._acquire(profile)
+        try:
+            info = ydl.extract_info(url, download=False)
+            return self._finish(ydl, info)
+        except Exception as e:
+            raise AnalysisError(str(e))
+        finally:
+            self._release(profile, ydl)
+
+    def extract_flat(self, url, cookies_from_browser=None, timeout=120, cancel_token=None):
+        """Return a playlist/channel with lightweight entries (extract_flat="in_playlist")"""
+        if cancel_token is not None and cancel_token.cancelled:
+            raise AnalysisCancelled("Analysis cancelled")
+        profile = (cookies_from_browser, timeout, True)
+        ydl = self._acquire(profile)
+        try:
+            return ydl.sanitize_info(ydl.extract_info(url, download=False))
+        except Exception as e:
+            raise AnalysisError(str(e))
+        finally:
+            self._release(profile, ydl)
+
+    def extract_many(self, urls, on_info, on_error, cookies_from_browser=None, timeout=30, cancel_token=None):
+        """Extract several URLs in order with one YoutubeDL instance, reporting each as it finishes.
+
+        A running extract_info call cannot be interrupted, so cancel_token
+        is checked between URLs and the rest are failed as cancelled.
+        """
+        profile = (cookies_from_browser, timeout, False)
+        ydl = self._acquire(profile)
+        try:
+            for url in urls:
+                if cancel_token is not None and cancel_token.cancelled:
+                    on_error(url, AnalysisCancelled("Analysis cancelled"))
+                    continue
+                try:
+                    info = self._finish(ydl, ydl.extract_info(url, download=False))
+                except Exception as e:
+                    on_error(url, AnalysisError(str(e)))
+                    continue
+                on_info(url, info)
+        finally:
+            self._release(profile, ydl)
+
+
+YOUTUBE_HOSTS = ("youtube.com", "youtube-nocookie.com", "youtu.be")
+YOUTUBE_ID_RE = re.compile(r"^[0-9A-Za-z_-]{11}$")
+YOUTUBE_PATH_RE = re.compile(r"^/(?:shorts|embed|live|v|e)/([0-9A-Za-z_-]{11})")
+
+
+@lru_cache(maxsize=4096)
+def canonicalize_url(url):
+    """Map a URL to an (extractor, id) key without network access.
+
+    YouTube URL forms (watch, youtu.be, m./music., shorts, embed, live) are
+    parsed directly. Other URLs are matched against yt-dlp's extractor
+    patterns, and anything else falls back to ("generic", url).
+    """
+    url = url.strip()
+    parsed = urlparse(url if "://" in url else "https://" + url)
+    host = (parsed.hostname or "").lower()
+    for prefix in ("www.", "m.", "music."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+
+    if host in YOUTUBE_HOSTS:
+        video_id = None
+        if host == "youtu.be":
+            video_id = parsed.path.strip("/").split("/")[0]
+        elif parsed.path == "/watch":
+            video_id = (parse_qs(parsed.query).get("v") or [None])[0]
+        else:
+            match = YOUTUBE_PATH_RE.match(parsed.path)
+            video_id = match.group(1) if match else None
+        if video_id and YOUTUBE_ID_RE.match(video_id):
+            return ("youtube", video_id)
+
+    # Ask yt-dlp's extractors (pure regex matching, no network)
+    match = match_extractor(url)
+    if match and match[1]:
+        return (match[0].lower(), match[1])
+
+    return ("generic", parsed._replace(fragment="").geturl())
+
+
+@lru_cache(maxsize=4096)
+def match_extractor(url):
+    """Find the yt-dlp extractor for url by its URL pattern: (ie_key, temp_id, return_type) or None"""
+    try:
+        from yt_dlp.extractor import gen_extractor_classes
+    except ImportError:
+        return None
+
+    for ie in gen_extractor_classes():
+        if ie.ie_key() != "Generic" and ie.suitable(url):
+            return (ie.ie_key(), ie.get_temp_id(url), getattr(ie, "_RETURN_TYPE", None))
+    return None
+
+
+def warm_extractor_matching():
+    """Import yt-dlp's extractors and compile their URL patterns once (about 0.7 s) so match_extractor takes milliseconds"""
+    match_extractor("https://example.invalid/")
+
+
+def is_collection_url(url):
+    """Whether url may be a playlist or channel (decided offline from the URL pattern)"""
+    if canonicalize_url(url)[0] == "youtube":
+        return False
+    match = match_extractor(url)
+    return bool(match) and match[2] in ("playlist", "any")
+
+
+def format_duration(duration):
+    """Format a duration in seconds as m:ss"""
+    return f"{int(duration//60)}:{int(duration%60):02d}" if duration else "Unknown"
+
+
+def get_video_key(url):
+    """Cache key for a URL: "<extractor> <id>" (same format as a yt-dlp download archive line)"""
+    extractor, video_id = canonicalize_url(url)
+    return f"{extractor} {video_id}"
+
+
+def get_host_key(url):
+    """Key that per-host download limits apply to: the extractor name, or the hostname for generic URLs"""
+    extractor, _ = canonicalize_url(url)
+    if extractor != "generic":
+        return extractor
+    return (urlparse(url if "://" in url else "https://" + url).hostname or "").lower()
+
+
+def dedupe_urls(urls):
+    """Remove URLs that point to the same video, keeping the first occurrence"""
+    seen = set()
+    unique = []
+    for url in urls:
+        key = get_video_key(url)
+        if key not in seen:
+            seen.add(key)
+            unique.append(url)
+    return unique
+
+
+def is_web_url(url):
+    """Whether url is an http(s) URL with a host (anything else is refused from the control API)"""
+    parsed = urlparse(url)
+    return parsed.scheme in ("http", "https") and bool(parsed.netloc)
+
+
+def add_options(cmd, options):
+    """Copy of a yt-dlp command with options added before the "--" that ends its options"""
+    end = cmd.index("--") if "--" in cmd else len(cmd)
+    return cmd[:end] + options + cmd[end:]
+
+
+# Output template printing only the fields analysis reads, as one JSON line per video
+LEAN_PRINT_TEMPLATE = (
+    '{"id": %(id|null)j, "extractor_key": %(extractor_key|null)j, '
+    '"original_url": %(original_url|null)j, "webpage_url": %(webpage_url|null)j, '
+    '"title": %(title|null)j, "duration": %(duration|null)j, "thumbnail": %(thumbnail|null)j, '
+    '"subtitle_langs": "%(subtitles|)l", "caption_langs": "%(automatic_captions|)l", '
+    '"formats": %(formats.:.{height,abr,tbr}|[])j, "expire_url": %(formats.-1.url|null)j}'
+)
+LEAN_FORMAT_FIELDS = ("height", "abr", "tbr")
+
+
+def lean_info(info):
+    """Reduce a full info dict to the compact record analysis needs (missing fields are left out)"""
+    record = {
+        "id": info.get("id"),
+        "extractor_key": info.get("extractor_key"),
+        "original_url": info.get("original_url"),
+        "webpage_url": info.get("webpage_url"),
+        "title": info.get("title"),
+        "duration": info.get("duration"),
+        "thumbnail": info.get("thumbnail"),
+        "subtitles": {lang: [] for lang in info.get("subtitles") or {}},
+        "automatic_captions": {lang: [] for lang in info.get("automatic_captions") or {}},
+        "formats": [{field: fmt[field] for field in LEAN_FORMAT_FIELDS if fmt.get(field)}
+                    for fmt in info.get("formats") or []],
+        "expire": get_format_expiry(info),
+    }
+    return {key: value for key, value in record.items() if value is not None}
+
+
+def parse_lean_line(line):
+    """Parse one LEAN_PRINT_TEMPLATE line into the same shape lean_info returns"""
+    record = json.loads(line)
+
+    def langs(text):
+        return {lang: [] for lang in text.split(", ") if re.match(r"^[\w-]+$", lang)}
+
+    expire_url = record.pop("expire_url", None)
+    record["subtitles"] = langs(record.pop("subtitle_langs", ""))
+    record["automatic_captions"] = langs(record.pop("caption_langs", ""))
+    record["expire"] = get_format_expiry({"formats": [{"url": expire_url}]}) if expire_url else None
+    return {key: value for key, value in record.items() if value is not None}
+
+
+def get_format_expiry(data):
+    """Return the earliest `expire` timestamp found in the format URLs of an info dict, or None"""
+    expiries = []
+    for fmt in data.get("formats") or []:
+        for key in ("url", "manifest_url"):
+            format_url = fmt.get(key)
+            if not format_url:
+                continue
+            expire = parse_qs(urlparse(format_url).query).get("expire")
+            if not expire:
+                # Manifest URLs carry it as a path segment: .../expire/1700000000/...
+                match = re.search(r"/expire/(\d+)", format_url)
+                expire = [match.group(1)] if match else None
+            if expire:
+                try:
+                    expiries.append(float(expire[0]))
+                except ValueError:
+                    pass
+    # Lean records carry the expiry directly instead of format URLs
+    return min(expiries) if expiries else data.get("expire")
+
+
+class AnalysisCache:
+    """Persistent analysis cache stored in SQLite.
+
+    Entries are keyed by "<extractor> <video id>" (see get_video_key), so
+    every URL form of a video shares one entry. Each entry expires when the
+    format URLs it was built from expire (or after default_ttl seconds), and
+    the least recently used entries are evicted once max_entries is exceeded.
+    A small in-memory LRU sits in front of the database so repeated lookups
+    stay cheap.
+    """
+
+    DEFAULT_TTL = 6 * 60 * 60
+
+    def __init__(self, db_path, max_entries=2000, default_ttl=DEFAULT_TTL):
+        self.db_path = str(db_path)
+        self.max_entries = max(1, int(max_entries))
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (entry, expires)
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS analysis (
+                key TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS analysis_last_access ON analysis (last_access);
+        """)
+        self._conn.commit()
+
+    def _fetch(self, key):
+        """Look up a live entry without touching the hit/miss counters (caller holds the lock)"""
+        now = time.time()
+        if key in self._memory:
+            entry, expires = self._memory[key]
+            if expires > now:
+                self._memory.move_to_end(key)
+                return entry
+            del self._memory[key]
+
+        row = self._conn.execute(
+            "SELECT data, expires FROM analysis WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] <= now:
+            if row is not None:
+                self._conn.execute("DELETE FROM analysis WHERE key = ?", (key,))
+                self._conn.commit()
+            return None
+
+        self._conn.execute("UPDATE analysis SET last_access = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        entry = json.loads(row[0])
+        self._remember(key, entry, row[1])
+        return entry
+
+    def get(self, key):
+        """Return the cached analysis entry for key, or None on a miss"""
+        with self._lock:
+            entry = self._fetch(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._fetch(key) is not None
+
+    def put(self, key, entry, expires=None):
+        """Store an analysis entry under key"""
+        now = time.time()
+        if not expires or expires <= now:
+            expires = now + self.default_ttl
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis (key, data, expires, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(entry, ensure_ascii=False), expires, now)
+            )
+            self._evict()
+            self._conn.commit()
+            self._remember(key, entry, expires)
+
+    def _remember(self, key, entry, expires):
+        """Keep an entry in the in-memory LRU"""
+        self._memory[key] = (entry, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """Drop expired entries and the least recently used ones beyond max_entries"""
+        self._conn.execute("DELETE FROM analysis WHERE expires <= ?", (time.time(),))
+        self._conn.execute("""
+            DELETE FROM analysis WHERE key IN (
+                SELECT key FROM analysis ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+
+    def stats_text(self):
+        """Short hit/miss summary for the log"""
+        return f"Analysis cache: {self.hits} hit(s), {self.misses} miss(es), {len(self)} entries"
+
+
+class InfoJsonStore:
+    """Gzip-compressed store of the full info dicts produced by analysis.
+
+    Downloads hand a stored info dict to yt-dlp with --load-info-json so the
+    page, player and formats are not extracted a second time. An entry is
+    only handed out while its format URLs stay valid for at least
+    min_validity seconds; entries without a known expiry last max_age
+    seconds. The oldest files are removed beyond max_entries.
+    """
+
+    def __init__(self, directory, max_entries=200, max_age=60 * 60, min_validity=10 * 60):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(1, int(max_entries))
+        self.max_age = max_age
+        self.min_validity = min_validity
+
+    def _path(self, key):
+        return self.directory / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}.info.json.gz"
+
+    def put(self, key, info):
+        """Compress and store the info dict for key"""
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=5) as f:
+            json.dump(info, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def load(self, key):
+        """Return the stored info dict for key, or None if it is missing or its format URLs are stale"""
+        path = self._path(key)
+        try:
+            stored = path.stat().st_mtime
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        expires = get_format_expiry(info) or stored + self.max_age
+        if expires - time.time() < self.min_validity:
+            path.unlink(missing_ok=True)
+            return None
+        return info
+
+    def export(self, key):
+        """Write the stored info for key to a plain .info.json temp file and return its path, or None"""
+        info = self.load(key)
+        if info is None:
+            return None
+        fd, path = tempfile.mkstemp(prefix="ytdlp_gui_", suffix=".info.json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+        return path
+
+    def _evict(self):
+        """Remove the oldest files beyond max_entries"""
+        files = []
+        for path in self.directory.glob("*.info.json.gz"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except OSError:
+                pass
+        files.sort()
+        for _, path in files[:-self.max_entries]:
+            path.unlink(missing_ok=True)
+
+
+class ThumbnailStore:
+    """Content-addressed thumbnail files with a byte cap, persisted across restarts.
+
+    Files are named by the SHA-256 of their bytes, so names stay stable
+    between sessions and an image shared by several videos is stored once.
+    A SQLite index maps video keys to files and records when each file was
+    last used; the least recently used files are deleted once all files
+    together exceed max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(str(self.directory / "index.db"), check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                digest TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS files_last_access ON files (last_access);
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                key TEXT PRIMARY KEY,
+                digest TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS thumbnails_digest ON thumbnails (digest);
+        """)
+        self._conn.commit()
+
+    def get(self, key):
+        """Path of the stored thumbnail for a video key, or None"""
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT files.digest, files.name FROM thumbnails JOIN files USING (digest) WHERE key = ?
+            """, (key,)).fetchone()
+            if row is None:
+                return None
+
+            path = self.directory / row[1]
+            if not path.exists():
+                self._forget(row[0])
+            else:
+                self._conn.execute("UPDATE files SET last_access = ? WHERE digest = ?", (time.time(), row[0]))
+            self._conn.commit()
+            return path if path.exists() else None
+
+    def put(self, key, data, ext=".jpg"):
+        """Store thumbnail bytes for a video key and return the file path"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.directory / f"{digest}{ext}"
+        with self._lock:
+            if not path.exists():
+                tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, path)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (digest, name, size, last_access) VALUES (?, ?, ?, ?)",
+                (digest, path.name, len(data), time.time())
+            )
+            self._conn.execute("INSERT OR REPLACE INTO thumbnails (key, digest) VALUES (?, ?)", (key, digest))
+            self._evict(keep=digest)
+            self._conn.commit()
+        return path
+
+    def fetch(self, key, url, timeout=15):
+        """Stored thumbnail path for key, downloading url first if it is not stored yet"""
+        path = self.get(key)
+        if path is not None:
+            return path
+        with urlopen(url, timeout=timeout) as response:
+            data = response.read()
+        return self.put(key, data, os.path.splitext(urlparse(url).path)[1] or ".jpg")
+
+    def _forget(self, digest):
+        """Drop a file and the keys pointing at it (caller holds the lock)"""
+        row = self._conn.execute("SELECT name FROM files WHERE digest = ?", (digest,)).fetchone()
+        if row:
+            (self.directory / row[0]).unlink(missing_ok=True)
+        self._conn.execute("DELETE FROM files WHERE digest = ?", (digest,))
+        self._conn.execute("DELETE FROM thumbnails WHERE digest = ?", (digest,))
+
+    def _evict(self, keep=None):
+        """Delete the least recently used files until the total size fits max_bytes"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+        rows = self._conn.execute("SELECT digest, size FROM files ORDER BY last_access").fetchall()
+        for digest, size in rows:
+            if total <= self.max_bytes:
+                break
+            if digest != keep:
+                self._forget(digest)
+                total -= size
+
+    def size(self):
+        """Total bytes of stored files"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+
+class DownloadJournal:
+    """Crash-safe record of queued downloads stored in SQLite (WAL mode).
+
+    Every job is written before it is scheduled and each state transition
+    (queued -> running -> done/failed/cancelled) is committed immediately,
+    so jobs that were queued or running when the app crashed or restarted
+    can be scheduled again on the next start. yt-dlp continues from the
+    .part files left in the output folder, so resumed jobs do not start
+    over from byte 0. Finished jobs are pruned after keep_days.
+    """
+
+    UNFINISHED = ("queued", "running")
+
+    def __init__(self, db_path, keep_days=7):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                title TEXT NOT NULL,
+                types TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                state TEXT NOT NULL,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+        """)
+        self.prune(keep_days * 24 * 60 * 60)
+
+    def add(self, url, title, types, settings):
+        """Record a queued job and return its id"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (url, title, types, settings, state, created, updated) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (url, title, json.dumps(list(types)), json.dumps(settings, ensure_ascii=False), now, now)
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def set_state(self, job_id, state, error=None):
+        """Record a state transition of a job"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, updated = ? WHERE id = ?",
+                (state, error, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def unfinished(self):
+        """Jobs that were queued or running when the app last stopped, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, url, title, types, settings FROM jobs WHERE state IN (?, ?) ORDER BY id",
+                self.UNFINISHED
+            ).fetchall()
+        return [
+            {"id": row[0], "url": row[1], "title": row[2],
+             "types": json.loads(row[3]), "settings": json.loads(row[4])}
+            for row in rows
+        ]
+
+    def prune(self, max_age):
+        """Drop finished jobs older than max_age seconds"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE state NOT IN (?, ?) AND updated < ?",
+                self.UNFINISHED + (time.time() - max_age,)
+            )
+            self._conn.commit()
+
+
+class DownloadArchive:
+    """Completed downloads keyed by (extractor, video id, format profile) in SQLite.
+
+    Works like yt-dlp's --download-archive, but the key also carries the
+    format profile (type and format settings, see get_download_profile), so
+    the same video in another quality or format is still downloaded. The
+    key is derived offline from the URL (see canonicalize_url), so archived
+    items are skipped before any extraction or network request.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS archive (
+                extractor TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                profile TEXT NOT NULL,
+                completed REAL NOT NULL,
+                PRIMARY KEY (extractor, video_id, profile)
+            ) WITHOUT ROWID;
+        """)
+        self._conn.commit()
+
+    def __contains__(self, item):
+        """item is (url, profile)"""
+        url, profile = item
+        extractor, video_id = canonicalize_url(url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM archive WHERE extractor = ? AND video_id = ? AND profile = ?",
+                (extractor, video_id, profile)
+            ).fetchone()
+        return row is not None
+
+    def add(self, url, profiles):
+        """Record the given profiles of url as downloaded"""
+        extractor, video_id = canonicalize_url(url)
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO archive (extractor, video_id, profile, completed) VALUES (?, ?, ?, ?)",
+                [(extractor, video_id, profile, now) for profile in profiles]
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM archive").fetchone()[0]
+
+
+class MetricsStore:
+    """Per-run download metrics stored in SQLite.
+
+    Every yt-dlp download run records its phase timings (extract, download,
+    merge, postprocess), bytes and mean/peak speed together with its host
+    and format profile. The dashboard reads throughput over time, the
+    slowest items and per-format averages from it. Only the newest
+    max_runs runs are kept.
+    """
+
+    PHASES = ("extract", "download", "merge", "postprocess")
+
+    def __init__(self, db_path, max_runs=10000):
+        self.db_path = str(db_path)
+        self.max_runs = max(1, int(max_runs))
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                title TEXT NOT NULL,
+                host TEXT NOT NULL,
+                profile TEXT NOT NULL,
+                success INTEGER NOT NULL,
+                started REAL NOT NULL,
+                extract REAL NOT NULL,
+                download REAL NOT NULL,
+                merge REAL NOT NULL,
+                postprocess REAL NOT NULL,
+                total REAL NOT NULL,
+                bytes INTEGER NOT NULL,
+                mean_speed REAL,
+                peak_speed REAL
+            );
+            CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+        """)
+        self._conn.commit()
+
+    def record(self, url, title, profile, success, started, phases, total, downloaded_bytes, peak_speed=None):
+        """Store one download run; phases maps each name in PHASES to seconds"""
+        download_time = phases.get("download", 0)
+        mean_speed = downloaded_bytes / download_time if downloaded_bytes and download_time > 0 else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO runs (url, title, host, profile, success, started, extract, download, merge, "
+                "postprocess, total, bytes, mean_speed, peak_speed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, title, get_host_key(url), profile, int(bool(success)), started,
+                 *(phases.get(phase, 0) for phase in self.PHASES),
+                 total, downloaded_bytes, mean_speed, peak_speed)
+            )
+            self._conn.execute(
+                "DELETE FROM runs WHERE id <= (SELECT MAX(id) FROM runs) - ?", (self.max_runs,)
+            )
+            self._conn.commit()
+
+    def throughput(self, since, bucket):
+        """[(bucket start, bytes, seconds spent downloading)] for runs started after since"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT CAST(started / ? AS INTEGER) * ? AS slot, SUM(bytes), SUM(download) FROM runs "
+                "WHERE started >= ? GROUP BY slot ORDER BY slot",
+                (bucket, bucket, since)
+            ).fetchall()
+
+    def slowest(self, limit=10):
+        """Successful runs with the lowest mean speed: (title, host, bytes, mean speed, total, *phase seconds)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT title, host, bytes, mean_speed, total, extract, download, merge, postprocess FROM runs "
+                "WHERE success = 1 AND mean_speed IS NOT NULL ORDER BY mean_speed LIMIT ?",
+                (limit,)
+            ).fetchall()
+
+    def by_profile(self):
+        """Averages per format profile: (profile, runs, failures, mean speed, total, *phase seconds)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT profile, COUNT(*), SUM(1 - success), AVG(mean_speed), AVG(total), "
+                "AVG(extract), AVG(download), AVG(merge), AVG(postprocess) FROM runs "
+                "GROUP BY profile ORDER BY COUNT(*) DESC"
+            ).fetchall()
+
+
+class AnalysisPool:
+    """Bounded worker pool that analyzes URLs concurrently.
+
+    Results are delivered in input order, each one as soon as it and every
+    URL before it have finished, so the UI can show progress while the rest
+    of the batch is still running. With a timeout, a URL that runs longer
+    fails with AnalysisError and its worker is abandoned (left to finish in
+    the background), so a hung extraction does not hold up the results
+    after it or keep a worker slot.
+    """
+
+    def __init__(self, max_workers=4, timeout=None):
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+
+    def run(self, items, worker, on_result):
+        """Run worker(item) for every item and call on_result(index, item, result, error) in order"""
+        items = list(items)
+        if not items:
+            return
+
+        def run_one(future, item):
+            try:
+                future.set_result(worker(item))
+            except Exception as e:
+                future.set_exception(e)
+
+        queued = deque(enumerate(items))
+        running = {}  # index -> (future, deadline or None)
+        ready = {}
+        next_index = 0
+
+        while queued or running:
+            while queued and len(running) < self.max_workers:
+                idx, item = queued.popleft()
+                future = Future()
+                thread = threading.Thread(target=run_one, args=(future, item))
+                thread.daemon = True
+                thread.start()
+                running[idx] = (future, time.monotonic() + self.timeout if self.timeout else None)
+
+            deadlines = [deadline for _, deadline in running.values() if deadline is not None]
+            wait_time = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            wait([future for future, _ in running.values()], timeout=wait_time, return_when=FIRST_COMPLETED)
+
+            now = time.monotonic()
+            for idx, (future, deadline) in list(running.items()):
+                if future.done():
+                    error = future.exception()
+                    ready[idx] = (None, error) if error else (future.result(), None)
+                elif deadline is not None and now >= deadline:
+                    ready[idx] = (None, AnalysisError(f"Analysis timed out after {self.timeout:g}s"))
+                else:
+                    continue
+                del running[idx]
+
+            # Flush every result that is now in order
+            while next_index in ready:
+                result, error = ready.pop(next_index)
+                on_result(next_index, items[next_index], result, error)
+                next_index += 1
+
+
+class SingleFlight:
+    """Registry of in-flight work keyed by video key.
+
+    The first caller for a key owns a Future and does the work; callers that
+    arrive while it is running get the same Future and wait on it instead of
+    starting a second extraction. A key leaves the registry once its Future
+    is resolved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> Future
+        self.joined = 0  # callers that waited on another caller's work
+
+    def begin(self, key):
+        """Return (future, owner) - the owner must resolve the future"""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.joined += 1
+                return future, False
+            future = Future()
+            self._flights[key] = future
+
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future, True
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+
+    def run(self, key, fn):
+        """Return fn(), or the result of the identical call already in flight for key"""
+        future, owner = self.begin(key)
+        if not owner:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+
+EXTERNAL_DOWNLOADERS = ("native", "aria2c", "axel", "curl", "wget")
+
+
+def get_download_engine_args(concurrent_fragments=1, http_chunk_size="", external_downloader="native",
+                             external_downloader_args=""):
+    """yt-dlp arguments for fragment concurrency, HTTP chunking and an external downloader"""
+    args = []
+    try:
+        fragments = int(concurrent_fragments or 1)
+    except (TypeError, ValueError):
+        fragments = 1
+    if fragments > 1:
+        args.extend(["--concurrent-fragments", str(fragments)])
+    if http_chunk_size:
+        args.extend(["--http-chunk-size", str(http_chunk_size)])
+    if external_downloader and external_downloader != "native":
+        args.extend(["--downloader", external_downloader])
+        if external_downloader_args:
+            args.extend(["--downloader-args", f"{external_downloader}:{external_downloader_args}"])
+    return args
+
+
+RATE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_rate(text):
+    """Parse a yt-dlp style rate ("500K", "4.2M", "1048576") into bytes/s, or 0 if empty/invalid"""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?)(?:i?B)?(?:/s)?\s*", str(text or ""), re.IGNORECASE)
+    if not match:
+        return 0
+    try:
+        return int(float(match.group(1)) * RATE_UNITS[match.group(2).upper()])
+    except ValueError:
+        return 0
+
+
+def format_rate(rate):
+    """Format bytes/s the way --limit-rate accepts it"""
+    for unit in ("G", "M", "K"):
+        if rate >= RATE_UNITS[unit]:
+            return f"{rate / RATE_UNITS[unit]:.2f}".rstrip("0").rstrip(".") + unit
+    return str(int(rate))
+
+
+# Progress lines are printed as JSON through --progress-template instead of the human-readable status line
+PROGRESS_PREFIX = "[progress] "
+PROGRESS_TEMPLATES = [
+    "download:" + PROGRESS_PREFIX + '{"stage":"download","status":%(progress.status)j,'
+    '"downloaded":%(progress.downloaded_bytes)j,"total":%(progress.total_bytes)j,'
+    '"estimate":%(progress.total_bytes_estimate)j,"speed":%(progress.speed)j,"eta":%(progress.eta)j,'
+    '"fragment":%(progress.fragment_index)j,"fragments":%(progress.fragment_count)j}',
+    "postprocess:" + PROGRESS_PREFIX + '{"stage":"postprocess","status":%(progress.status)j,'
+    '"postprocessor":%(progress.postprocessor)j}',
+]
+
+
+def get_progress_args(delta=0.5):
+    """yt-dlp arguments for JSON progress lines, at most one every delta seconds"""
+    args = []
+    for template in PROGRESS_TEMPLATES:
+        args.extend(["--progress-template", template])
+    if delta:
+        args.extend(["--progress-delta", str(delta)])
+    return args
+
+
+def parse_progress_line(line):
+    """Parse a progress line printed with PROGRESS_TEMPLATES into a dict, or None for other lines.
+
+    Download progress also gets "fraction" (0-1, from the total or the
+    estimated size) when the size is known.
+    """
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    # Missing fields are printed as NA
+    text = re.sub(r":NA(?=[,}])", ":null", line[len(PROGRESS_PREFIX):])
+    try:
+        progress = json.loads(text)
+    except ValueError:
+        return None
+    size = progress.get("total") or progress.get("estimate")
+    if progress.get("downloaded") is not None and size:
+        progress["fraction"] = min(1.0, progress["downloaded"] / size)
+    return progress
+
+
+def format_progress(progress):
+    """Short status text for a parsed progress dict, e.g. "42% · 3.1MB/s · ETA 0:12 · 5/40" """
+    if progress["stage"] == "postprocess":
+        return progress.get("postprocessor") or progress["stage"]
+    parts = []
+    if progress.get("fraction") is not None:
+        parts.append(f"{progress['fraction'] * 100:.0f}%")
+    if progress.get("speed"):
+        parts.append(f"{format_rate(progress['speed'])}B/s")
+    if progress.get("eta") is not None:
+        parts.append(f"ETA {format_duration(progress['eta']) if progress['eta'] else '0:00'}")
+    if progress.get("fragments"):
+        parts.append(f"{progress.get('fragment') or 0}/{progress['fragments']}")
+    return " · ".join(parts)
+
+
+def iter_output_lines(stream, chunk_size=64 * 1024):
+    """Yield the lines of a binary process stream, reading it in chunks of up to chunk_size bytes"""
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+    pending = ""
+    while True:
+        chunk = stream.read1(chunk_size)
+        if not chunk:
+            break
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        yield from lines
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+class BandwidthBudget:
+    """Global download rate (bytes/s) shared by the running download jobs.
+
+    The rate is split evenly across the jobs holding a share, and each job
+    runs with its share as --limit-rate, so the shares never add up to more
+    than the budget. When a job joins or leaves, the shares are recomputed
+    and every job whose share changed is told through its callback, so a
+    finished job's share goes to the jobs still running and the link stays
+    busy up to the cap.
+    """
+
+    def __init__(self, rate=0):
+        self.rate = max(0, int(rate))
+        self._lock = threading.Lock()
+        self._jobs = {}  # job id -> callback
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def share(self):
+        """Current per-job share, rounded down so the sum stays within rate (caller holds the lock)"""
+        return max(1, self.rate // max(1, len(self._jobs)))
+
+    def acquire(self, job_id, callback):
+        """Add a job and return its share; callback(share) is called when the share changes.
+
+        Callbacks run under the lock, so concurrent joins and leaves reach
+        every job in the order the shares were computed; they must not block.
+        """
+        with self._lock:
+            self._jobs[job_id] = callback
+            share = self.share()
+            for other_id, other in self._jobs.items():
+                if other_id != job_id:
+                    other(share)
+            return share
+
+    def release(self, job_id):
+        """Remove a finished job and hand its share to the others"""
+        with self._lock:
+            if self._jobs.pop(job_id, None) is None:
+                return
+            share = self.share()
+            for other in self._jobs.values():
+                other(share)
+
+
+class DownloadScheduler:
+    """Queue of download jobs run with a global concurrency limit and a per-host cap.
+
+    Jobs start in submission order, except that a job whose host is already
+    at its cap stays queued while later jobs for other hosts go ahead.
+    host_limits overrides per_host for individual hosts (see get_host_key).
+    """
+
+    def __init__(self, max_concurrent=3, per_host=2, host_limits=None):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.per_host = max(1, int(per_host))
+        self.host_limits = dict(host_limits or {})
+        self._lock = threading.Lock()
+        self._queue = []  # [(future, fn, host), ...]
+        self._running = {}  # host -> running job count
+
+    def limit_for(self, host):
+        return max(1, int(self.host_limits.get(host, self.per_host)))
+
+    def submit(self, fn, host):
+        """Queue fn() as a job for host and return a Future for its result"""
+        future = Future()
+        with self._lock:
+            self._queue.append((future, fn, host))
+            self._dispatch()
+        return future
+
+    @property
+    def active(self):
+        with self._lock:
+            return sum(self._running.values())
+
+    @property
+    def queued(self):
+        with self._lock:
+            return len(self._queue)
+
+    def _dispatch(self):
+        """Start every queued job that fits the limits (caller holds the lock)"""
+        for item in list(self._queue):
+            if sum(self._running.values()) >= self.max_concurrent:
+                break
+            future, fn, host = item
+            if self._running.get(host, 0) >= self.limit_for(host):
+                continue
+            self._queue.remove(item)
+            self._running[host] = self._running.get(host, 0) + 1
+            thread = threading.Thread(target=self._run, args=item)
+            thread.daemon = True
+            thread.start()
+
+    def _run(self, future, fn, host):
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._running[host] -= 1
+                self._dispatch()
+
+
+class LogPipeline:
+    """Thread-safe buffer between log_message callers and the log textbox.
+
+    Any thread can put lines; the Tk main loop drains them in batches every
+    few milliseconds, so a burst of yt-dlp output costs one textbox insert
+    per batch instead of one redraw per line. Every line is also written to
+    a rotating log file (max_bytes per file, backups old files kept), since
+    the textbox only keeps the most recent lines.
+    """
+
+    def __init__(self, log_path=None, max_bytes=5 * 1024 * 1024, backups=3):
+        self._lines = deque()
+        self._lock = threading.Lock()
+        self._file = None
+        if log_path:
+            Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+            self._file = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups,
+                                             encoding="utf-8", delay=True)
+
+    def put(self, message):
+        with self._lock:
+            self._lines.append((time.time(), message))
+
+    def drain(self):
+        """Remove and return all pending messages, writing them to the log file"""
+        with self._lock:
+            if not self._lines:
+                return []
+            lines, self._lines = self._lines, deque()
+
+        messages = [message for _, message in lines]
+        if self._file is not None:
+            # One timestamp string per second and one write per batch
+            stamps = {}
+            output = []
+            for t, message in lines:
+                second = int(t)
+                if second not in stamps:
+                    stamps[second] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+                output.append(f"{stamps[second]} {message}")
+            text = "\n".join(output)
+            self._file.handle(logging.makeLogRecord({"msg": text}))
+        return messages
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def get_ytdlp_command():
+    """Get yt-dlp command - works in both dev and bundled mode"""
+    if getattr(sys, 'frozen', False):
+        # Running as compiled executable - use Python module
+        return [sys.executable, "-m", "yt_dlp"]
+    else:
+        # Running as script - use yt-dlp command
+        return ["yt-dlp"]
+
+
+def get_config_path():
+    """Get path for config file - writable location"""
+    if getattr(sys, 'frozen', False):
+        # Running as compiled executable - use user home directory
+        config_dir = Path.home() / ".ib_youtube_downloader"
+        config_dir.mkdir(exist_ok=True)
+        return config_dir / "config.json"
+    else:
+        # Running as script - use script directory
+        return Path(__file__).parent / "config.json"
+
+
+def load_config(config_file=None):
+    """Load configuration from config.json"""
+    try:
+        with open(config_file or get_config_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"language": "ko"}  # Default config
+
+
+# yt-dlp options the engine uses that older versions may lack (see ToolRegistry)
+YTDLP_FEATURES = ("--progress-template", "--progress-delta", "--load-info-json", "--concurrent-fragments",
+                  "--remux-video", "--convert-subs", "--cookies-from-browser", "--downloader")
+
+# ffmpeg libraries behind the audio/video formats offered in the GUI
+FFMPEG_FEATURES = ("libmp3lame", "libopus", "libvorbis", "libfdk-aac", "libx264", "libx265", "libvpx",
+                   "libaom", "libdav1d", "libsvtav1")
+
+
+def run_tool(command, timeout=10):
+    """stdout of a tool that has to exit successfully"""
+    return subprocess.run(command, capture_output=True, text=True, timeout=timeout, check=True).stdout
+
+
+def probe_ytdlp(command):
+    help_text = run_tool(command + ["--help"])
+    return {
+        "version": run_tool(command + ["--version"]).strip(),
+        "features": {flag.lstrip("-"): flag in help_text for flag in YTDLP_FEATURES}
+    }
+
+
+def probe_ffmpeg(command):
+    # "ffmpeg version 6.1.1 Copyright ..." followed by "configuration: --enable-libmp3lame ..."
+    output = run_tool(command + ["-version"])
+    return {
+        "version": output.split()[2],
+        "features": {lib: f"--enable-{lib}" in output for lib in FFMPEG_FEATURES}
+    }
+
+
+def probe_aria2c(command):
+    # "aria2 version 1.37.0" ... "Enabled Features: Async DNS, BitTorrent, ..., HTTPS, ..."
+    output = run_tool(command + ["--version"])
+    enabled = re.search(r"^Enabled Features: (.*)$", output, re.MULTILINE)
+    return {
+        "version": output.split()[2],
+        "features": {name.strip(): True for name in enabled.group(1).split(",")} if enabled else {}
+    }
+
+
+def probe_version(command):
+    """First line of --version, for tools without a dedicated probe"""
+    return {"version": run_tool(command + ["--version"]).splitlines()[0].strip(), "features": {}}
+
+
+TOOL_PROBES = {"yt-dlp": probe_ytdlp, "ffmpeg": probe_ffmpeg, "ffprobe": probe_ffmpeg, "aria2c": probe_aria2c}
+
+
+class ToolRegistry:
+    """Versions and features of yt-dlp, ffmpeg/ffprobe and external downloaders, probed once.
+
+    A tool is run the first time it is looked up; the result is kept in
+    memory for the rest of the session and stored in a JSON file keyed by
+    the binary's path, size and mtime, so later starts only run it again
+    after it was replaced or updated. Tools that are not installed are
+    looked up again on the next start.
+    """
+
+    def __init__(self, cache_path, ytdlp_command=None):
+        self.cache_path = Path(cache_path)
+        self.ytdlp_command = ytdlp_command or get_ytdlp_command()
+        self._tools = {}  # name -> info dict, or None if the tool is missing
+        self._lock = threading.Lock()
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                self._stored = json.load(f)  # name -> info dict with path, size and mtime
+        except (OSError, ValueError):
+            self._stored = {}
+
+    def command(self, name):
+        return list(self.ytdlp_command) if name == "yt-dlp" else [name]
+
+    def get(self, name):
+        """{"path", "version", "features", ...} of a tool, or None if it is not installed"""
+        with self._lock:
+            if name not in self._tools:
+                self._tools[name] = self._probe(name)
+            return self._tools[name]
+
+    def available(self, name):
+        return self.get(name) is not None
+
+    def has_feature(self, name, feature):
+        """Whether an installed tool reports a feature (see YTDLP_FEATURES, FFMPEG_FEATURES)"""
+        info = self.get(name)
+        return bool(info and info["features"].get(feature))
+
+    def refresh(self, name):
+        """Forget a tool (e.g. after yt-dlp -U) so the next lookup probes it again"""
+        with self._lock:
+            self._tools.pop(name, None)
+            self._stored.pop(name, None)
+
+    def _probe(self, name):
+        """Stored info if the binary is unchanged, else run the tool (caller holds the lock)"""
+        command = self.command(name)
+        path = shutil.which(command[0])
+        if path is None:
+            return None
+        stat = os.stat(path)
+        stored = self._stored.get(name)
+        if stored and (stored["path"], stored["size"], stored["mtime"]) == (path, stat.st_size, stat.st_mtime):
+            return stored
+
+        try:
+            info = TOOL_PROBES.get(name, probe_version)(command)
+        except (OSError, subprocess.SubprocessError, IndexError):
+            return None
+        info.update(path=path, size=stat.st_size, mtime=stat.st_mtime, probed=time.time())
+        self._stored[name] = info
+        try:
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._stored, f, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+        return info
+
+
+DOWNLOAD_TYPES = ("video", "audio", "thumbnail", "subtitle")
+VIDEO_CODECS = {"av1": "[vcodec^=av01]", "vp9": "[vcodec^=vp9]", "vp8": "[vcodec^=vp8]", "avc": "[vcodec^=avc]"}
+
+
+def build_format_string(height=None, codec=None, audio_bitrate=None):
+    """yt-dlp format selection for a video download (None = no limit / any codec)"""
+    video_selector = "bestvideo"
+    if height:
+        video_selector += f"[height<={height}]"
+    video_selector += VIDEO_CODECS.get(codec, "")
+    if audio_bitrate:
+        return f"{video_selector}+bestaudio[abr<={audio_bitrate}]/best"
+    return f"{video_selector}+bestaudio/best"
+
+
+class DownloadEngine:
+    """Analysis, download and queue logic shared by the GUI and the headless CLI.
+
+    Download settings are plain dicts with the keys below; missing keys use
+    the defaults from config.json. Nothing here touches Tk: progress and log
+    output go through callbacks.
+
+        download_path, video_height, video_codec (see VIDEO_CODECS),
+        audio_bitrate, video_container, audio_format, subtitle_format,
+        subtitle_language, embed_thumbnail, embed_metadata,
+        cookies_from_browser, concurrent_fragments, http_chunk_size,
+        external_downloader
+    """
+
+    FINISHED_STATES = ("done", "failed", "cancelled")
+
+    def __init__(self, config, data_dir, log=print, cookies_from_browser=None):
+        self.config = config
+        self.data_dir = Path(data_dir)
+        self.log = log
+        self.cookies_from_browser = cookies_from_browser or (lambda: None)  # browser[:profile] used for analysis
+        self.on_thumbnail = None  # on_thumbnail(thumbnail_url, video_key) when an analysis has a thumbnail
+
+        # Video analysis cache - stores analysis results to avoid re-analyzing (persisted across restarts)
+        self.video_analysis_cache = AnalysisCache(  # video key -> video_info dict
+            self.data_dir / "analysis_cache.db",
+            max_entries=config.get("analysis_cache_size", 2000)
+        )
+
+        # URLs currently being extracted - auto-analysis and the batch window share one extraction per video
+        self.analysis_flights = SingleFlight()
+
+        # Full info dicts from analysis, reused by downloads through --load-info-json
+        self.reuse_info_json = config.get("reuse_info_json", True)
+        self.extraction_time_estimate = None  # seconds of the last measured download-time extraction
+        self.info_json_store = InfoJsonStore(
+            self.data_dir / "info_json",
+            max_entries=config.get("info_json_cache_size", 200)
+        )
+
+        # Download engine defaults (overridable per download)
+        self.concurrent_fragments = int(config.get("concurrent_fragments", 4))
+        self.http_chunk_size = config.get("http_chunk_size", "")
+        self.external_downloader = config.get("external_downloader", "native")
+        self.external_downloader_args = config.get("external_downloader_args", "-x 8 -s 8 -k 1M")
+        self.progress_delta = float(config.get("progress_delta", 0.5))
+
+        # Combined download rate cap shared by all running jobs ("" or 0 = unlimited)
+        self.bandwidth_budget = BandwidthBudget(parse_rate(config.get("bandwidth_limit", "")))
+        self.bandwidth_rebalance_ratio = float(config.get("bandwidth_rebalance_ratio", 0.25))
+        self.bandwidth_rebalance_interval = float(config.get("bandwidth_rebalance_interval", 10))
+
+        # Download scheduler - jobs run concurrently, limited globally and per extractor/host
+        self.scheduler = DownloadScheduler(
+            config.get("max_concurrent_downloads", 3),
+            config.get("max_downloads_per_host", 2),
+            config.get("download_host_limits", {})
+        )
+        self.download_processes = set()  # running yt-dlp download processes, stopped before a restart
+        self.restarting = False  # set by stop_downloads - stopped jobs stay unfinished in the journal
+
+        # Jobs of this session, shown by the GUI and the control API (finished ones up to job_history_size)
+        self.jobs = OrderedDict()  # job id (journal id) -> job dict, see submit
+        self.job_history_size = int(config.get("job_history_size", 500))
+        self._jobs_lock = threading.Lock()
+        self._job_tokens = {}  # job id -> CancelToken of a queued or running job
+        self._job_listeners = []
+
+        # Journal of queued jobs - unfinished ones are resumed from their .part files on the next start
+        self.journal = DownloadJournal(self.data_dir / "download_queue.db")
+
+        # Download metrics (phase timings, bytes, speeds per run)
+        self.collect_metrics = config.get("collect_metrics", True)
+        self.metrics = MetricsStore(
+            self.data_dir / "metrics.db",
+            max_runs=config.get("metrics_max_runs", 10000)
+        )
+
+        # Archive of finished downloads - items already downloaded with the same settings are skipped
+        self.use_download_archive = config.get("use_download_archive", True)
+        self.archive = DownloadArchive(self.data_dir / "download_archive.db")
+
+        # Analysis pool settings (number of concurrent yt-dlp processes, seconds per URL)
+        self.analysis_workers = int(config.get("analysis_workers", 4))
+        self.analysis_timeout = int(config.get("analysis_timeout", 30))
+
+        # Analysis mode ("pool" extracts each URL separately, "batched" shares one extraction per chunk of URLs)
+        self.analysis_mode = config.get("analysis_mode", "pool")
+        self.analysis_batch_size = max(1, int(config.get("analysis_batch_size", 25)))
+
+        # Seconds allowed for a flat playlist/channel listing
+        self.playlist_timeout = int(config.get("playlist_timeout", 120))
+
+        # Extraction backend ("inprocess" uses the yt_dlp module, "subprocess" runs yt-dlp)
+        self.extractor = self.create_extractor(config.get("extraction_backend", "inprocess"))
+
+        # yt-dlp, ffmpeg and external downloader versions/features, probed once per binary
+        self.tools = ToolRegistry(self.data_dir / "tools.json")
+        self.ffmpeg_warned = False
+
+    def create_extractor(self, backend):
+        """Create the analysis backend, falling back to subprocess if yt_dlp cannot be imported"""
+        lean = bool(self.config.get("analysis_lean", False))
+        if backend == "inprocess" and InProcessExtractor.is_available():
+            return InProcessExtractor(lean=lean)
+        return SubprocessExtractor(get_ytdlp_command(), lean=lean)
+
+    def analyze_url(self, url, cancel_token=None):
+        """Analyze a single URL and return the cached analysis entry (runs in a worker thread)"""
+        # Read through the persistent analysis cache first
+        video_key = get_video_key(url)
+        cached = self.video_analysis_cache.get(video_key)
+        if cached is not None:
+            if cached["thumbnail_url"] and self.on_thumbnail:
+                self.on_thumbnail(cached["thumbnail_url"], video_key)
+            return cached
+
+        def extract():
+            data = self.extractor.extract(url, self.cookies_from_browser(), self.analysis_timeout, cancel_token)
+            return self.store_analysis(url, data)
+
+        # Join the extraction another caller already started for this video
+        while True:
+            try:
+                return self.analysis_flights.run(video_key, extract)
+            except AnalysisCancelled:
+                # The run that owned the extraction was cancelled - retry unless this one was too
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise
+
+    def store_analysis(self, url, data):
+        """Summarize an info dict into an analysis entry and store it in the analysis cache"""
+        video_key = get_video_key(url)
+
+        # Find max video height and audio bitrate
+        max_height = 0
+        max_audio_br = 0
+
+        for fmt in data.get("formats", []):
+            # Check video height
+            if fmt.get("height"):
+                max_height = max(max_height, fmt["height"])
+
+            # Check audio bitrate
+            if fmt.get("abr"):
+                max_audio_br = max(max_audio_br, fmt["abr"])
+            elif fmt.get("tbr") and not fmt.get("height"):  # Audio-only format
+                max_audio_br = max(max_audio_br, fmt["tbr"])
+
+        video_title = data.get("title", "Unknown")
+        duration_str = format_duration(data.get("duration", 0))
+
+        # Download and cache thumbnail
+        thumbnail_url = data.get("thumbnail", "")
+        if thumbnail_url and self.on_thumbnail:
+            self.on_thumbnail(thumbnail_url, video_key)
+
+        # Get available subtitles
+        subtitles = data.get("subtitles", {})
+        automatic_captions = data.get("automatic_captions", {})
+        available_subtitle_langs = list(set(list(subtitles.keys()) + list(automatic_captions.keys())))
+        if not available_subtitle_langs:
+            available_subtitle_langs = ["en"]  # Default to English if no subtitles found
+
+        # Cache the analysis result for reuse in batch download
+        entry = {
+            "url": url,
+            "key": video_key,
+            "title": video_title,
+            "duration": duration_str,
+            "thumbnail_url": thumbnail_url,
+            "max_height": max_height,
+            "max_audio_bitrate": int(max_audio_br),
+            "available_subtitle_langs": available_subtitle_langs
+        }
+        self.video_analysis_cache.put(video_key, entry, expires=get_format_expiry(data))
+
+        # Lean records lack the format URLs a download needs
+        if self.reuse_info_json and not self.extractor.lean:
+            try:
+                self.info_json_store.put(video_key, data)
+            except (OSError, TypeError, ValueError) as e:
+                self.log(f"Could not store info-json for {url}: {str(e)}")
+        return entry
+
+    def expand_url(self, url, depth=0, cancel_token=None):
+        """Expand a playlist/channel URL into flat entries, or return None if it is a single video"""
+        if not is_collection_url(url):
+            return None
+
+        data = self.extractor.extract_flat(url, self.cookies_from_browser(), self.playlist_timeout, cancel_token)
+        if data.get("_type") != "playlist":
+            # The URL pattern allowed a playlist but this one is a single video - keep its analysis
+            if data.get("formats"):
+                self.store_analysis(url, data)
+            return None
+
+        entries = []
+        for entry in data.get("entries") or []:
+            entry_url = entry.get("url") or entry.get("webpage_url")
+            if not entry_url:
+                continue
+
+            # Channel pages list their tabs (videos, shorts, live) as nested playlists
+            if entry.get("_type") == "url" and depth < 2 and is_collection_url(entry_url):
+                try:
+                    nested = self.expand_url(entry_url, depth + 1, cancel_token)
+                except AnalysisCancelled:
+                    raise
+                except AnalysisError as e:
+                    self.log(f"✗ Failed to expand {entry_url}: {str(e)}")
+                    continue
+                if nested is not None:
+                    entries.extend(nested["entries"])
+                    continue
+
+            entries.append({
+                "url": entry_url,
+                "title": entry.get("title"),
+                "duration": entry.get("duration")
+            })
+
+        return {"title": data.get("title") or url, "entries": entries}
+
+    def expand_urls(self, urls):
+        """Expand playlist/channel URLs into a flat, de-duplicated list of {"url", "title", "duration"} items"""
+        items = []
+        seen = set()
+
+        for url in urls:
+            try:
+                expanded = self.expand_url(url)
+            except AnalysisError as e:
+                self.log(f"✗ Failed to expand playlist {url}: {str(e)}")
+                expanded = None
+
+            entries = [{"url": url}] if expanded is None else expanded["entries"]
+            if expanded is not None:
+                self.log(f"Playlist: {expanded['title']} - {len(entries)} video(s)")
+
+            for entry in entries:
+                key = get_video_key(entry["url"])
+                if key not in seen:
+                    seen.add(key)
+                    items.append(entry)
+
+        return items
+
+    def run_analysis(self, urls, on_result, cancel_token=None):
+        """Analyze URLs with the worker pool, calling on_result(idx, url, entry, error) in order"""
+        if cancel_token is None:
+            cancel_token = CancelToken()
+
+        if self.analysis_mode == "batched":
+            self.run_batched_analysis(urls, on_result, cancel_token)
+            return
+
+        def worker(url):
+            # URLs still queued when the run is cancelled are skipped without starting yt-dlp
+            cancel_token.check()
+            return self.analyze_url(url, cancel_token)
+
+        # The in-process backend has no way to stop a hung extract_info, so the pool enforces the
+        # per-URL limit; the grace period lets the subprocess backend's own timeout kill yt-dlp first
+        pool = AnalysisPool(self.analysis_workers, timeout=self.analysis_timeout + 5)
+        pool.run(urls, worker, on_result)
+
+    def run_batched_analysis(self, urls, on_result, cancel_token=None):
+        """Analyze uncached URLs in chunks of analysis_batch_size, one yt-dlp invocation per chunk.
+
+        Each chunk streams its results into the analysis cache as soon as a
+        video is parsed; on_result still receives them in input order.
+        """
+        pending = OrderedDict()  # url -> Future resolved by the chunk that contains it, or by another caller
+        owned = []  # pending URLs this run extracts itself
+        for url in urls:
+            video_key = get_video_key(url)
+            if url not in pending and video_key not in self.video_analysis_cache:
+                pending[url], owner = self.analysis_flights.begin(video_key)
+                if owner:
+                    owned.append(url)
+
+        if cancel_token is None:
+            cancel_token = CancelToken()
+
+        def extract_chunk(chunk):
+            def on_info(url, data):
+                try:
+                    pending[url].set_result(self.store_analysis(url, data))
+                except Exception as e:
+                    pending[url].set_exception(e)
+
+            def on_error(url, error):
+                pending[url].set_exception(error)
+
+            try:
+                cancel_token.check(len(chunk))
+                self.extractor.extract_many(chunk, on_info, on_error, self.cookies_from_browser(),
+                                            self.analysis_timeout, cancel_token)
+            except Exception as e:
+                for url in chunk:
+                    if not pending[url].done():
+                        pending[url].set_exception(e)
+
+        def wait_for(url):
+            """Return a URL's result from its chunk, or from the cache if it was not pending"""
+            if url in pending:
+                try:
+                    return pending[url].result()
+                except AnalysisCancelled:
+                    # Another run owned this URL and was cancelled - fall back to a single extraction
+                    if cancel_token.cancelled:
+                        raise
+            return self.analyze_url(url, cancel_token)
+
+        chunks = [owned[i:i + self.analysis_batch_size]
+                  for i in range(0, len(owned), self.analysis_batch_size)]
+        if chunks:
+            self.log(f"Batched analysis: {len(owned)} URL(s) in {len(chunks)} yt-dlp invocation(s)")
+        if len(owned) < len(pending):
+            self.log(f"Batched analysis: {len(pending) - len(owned)} URL(s) already being analyzed elsewhere")
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.analysis_workers, len(chunks))))
+        try:
+            for chunk in chunks:
+                executor.submit(extract_chunk, chunk)
+            AnalysisPool(self.analysis_workers).run(urls, wait_for, on_result)
+        finally:
+            executor.shutdown(wait=False)
+
+    def should_rebalance(self, rate, started):
+        """Whether a run should restart with its new bandwidth share.
+
+        A lower share restarts the run right away so the budget is never
+        exceeded. Restarts cost a reconnect, so a higher share only does once
+        it differs by more than bandwidth_rebalance_ratio and the run has been
+        going for bandwidth_rebalance_interval seconds.
+        """
+        current, target = rate["current"], rate["target"]
+        if current is None or target is None or target == current:
+            return False
+        if target < current:
+            return True
+        if time.monotonic() - started < self.bandwidth_rebalance_interval:
+            return False
+        return abs(target - current) / current > self.bandwidth_rebalance_ratio
+
+    def plan_download_jobs(self, types):
+        """Group download types into yt-dlp runs: thumbnail/subtitle files ride along with the first media run"""
+        media = [t for t in ("video", "audio") if t in types]
+        files = [t for t in ("thumbnail", "subtitle") if t in types]
+        if not media:
+            return [files] if files else []
+
+        # Video and extracted audio need different format selections, so audio gets its own run
+        jobs = [media[:1] + files]
+        jobs.extend([m] for m in media[1:])
+        return jobs
+
+    def get_download_profile(self, download_type, settings):
+        """Archive profile of one download type: the type plus the settings that change its output file"""
+        bitrate = settings.get("audio_bitrate") or "best"
+        if download_type == "video":
+            codec = VIDEO_CODECS.get(settings.get("video_codec"), "")
+            container = settings.get("video_container") or "mp4"
+            return f"video:{settings.get('video_height') or 'best'}:{codec}:{bitrate}:{container}"
+        if download_type == "audio":
+            return f"audio:{settings.get('audio_format') or 'mp3'}:{bitrate}"
+        if download_type == "subtitle":
+            return f"subtitle:{settings.get('subtitle_format') or 'srt'}:{settings.get('subtitle_language') or 'en'}"
+        return download_type
+
+    def filter_archived(self, url, types, settings):
+        """Types of url that are not in the download archive yet (all of them if the archive is disabled)"""
+        if not self.use_download_archive:
+            return list(types)
+        return [t for t in types if (url, self.get_download_profile(t, settings)) not in self.archive]
+
+    def download_with_types(self, url, types, settings, progress=None, stats=None, cancel_token=None):
+        """Download the selected types of one URL with as few yt-dlp runs and extractions as possible.
+
+        progress(fraction, text, details) receives the progress of the whole
+        job; stats receives the downloaded bytes of all runs, the title and
+        the first yt-dlp error. cancel_token stops the job between and during runs.
+        """
+        jobs = self.plan_download_jobs(types)
+        if not jobs:
+            return True
+
+        # The first run saves its info so the remaining runs start from it instead of extracting again
+        shared_dir = tempfile.mkdtemp(prefix="ytdlp_gui_") if len(jobs) > 1 else None
+        shared_info = os.path.join(shared_dir, "shared") if shared_dir else None
+        extractions = 0
+        success = True
+        try:
+            for index, job in enumerate(jobs):
+                if cancel_token is not None and cancel_token.cancelled:
+                    success = False
+                    break
+                self.log(f"Downloading {' + '.join(job)}...")
+                run_progress = None
+                if progress is not None:
+                    # Each run fills its share of the job's progress
+                    def report_run(fraction, text, details=None, index=index):
+                        progress(None if fraction is None else (index + fraction) / len(jobs), text, details)
+                    run_progress = report_run
+
+                run_stats = {}
+                shared_exists = shared_info is not None and os.path.exists(shared_info + ".info.json")
+                run_success = self.download(
+                    url,
+                    job,
+                    settings,
+                    info_json=shared_info + ".info.json" if shared_exists else None,
+                    write_info_json=shared_info if shared_info and not shared_exists else None,
+                    stats=run_stats,
+                    progress=run_progress,
+                    cancel_token=cancel_token
+                )
+                if run_success and self.use_download_archive:
+                    self.archive.add(url, [self.get_download_profile(t, settings) for t in job])
+                success &= run_success
+                if stats is not None:
+                    stats["downloaded_bytes"] = stats.get("downloaded_bytes", 0) + run_stats.get("downloaded_bytes", 0)
+                    stats["title"] = stats.get("title") or run_stats.get("title")
+                    stats["error"] = stats.get("error") or run_stats.get("error")
+                if run_stats.get("extracted"):
+                    extractions += 1
+                    if run_stats.get("extraction_time") is not None:
+                        self.extraction_time_estimate = run_stats["extraction_time"]
+        finally:
+            if shared_dir:
+                shutil.rmtree(shared_dir, ignore_errors=True)
+
+        # Previously every type was its own run with its own extraction
+        saved = len(types) - extractions
+        if saved > 0:
+            estimate = ""
+            if self.extraction_time_estimate is not None:
+                estimate = f" (~{saved * self.extraction_time_estimate:.1f}s)"
+            self.log(f"{len(types)} type(s) in {len(jobs)} yt-dlp run(s) with {extractions} extraction(s) - "
+                     f"saved {saved} extraction(s){estimate}")
+        return success
+
+    def enqueue(self, urls, types, settings):
+        """Expand playlist/channel URLs, skip items already in the download archive and submit the rest.
+
+        Returns one {"url", "title", "types", "future"} dict per item, with
+        the types still to download; future is None for skipped items.
+        """
+        items = []
+        for entry in self.expand_urls(urls):
+            url = entry["url"]
+            cached = self.video_analysis_cache.get(get_video_key(url))
+            title = entry.get("title") or (cached["title"] if cached else url)
+
+            # Already downloaded with these settings - skipped before any yt-dlp run
+            remaining = self.filter_archived(url, types, settings)
+            future = self.submit(url, title, remaining, settings) if remaining else None
+            items.append({"url": url, "title": title, "types": remaining or list(types), "future": future})
+        return items
+
+    def submit(self, url, title, types, settings, journal_id=None):
+        """Queue the selected types of url on the download scheduler and return a Future.
+
+        The job is recorded in the download journal (journal_id continues an
+        existing record) so it can be resumed if the app stops before it ends,
+        and in jobs under the journal id, which is also the Future's job_id.
+        Listeners see its state go from "queued" to "running", then "done",
+        "failed" or "cancelled". The Future resolves to {"success", "error",
+        "title", "downloaded_bytes", "seconds"}; title is the file name
+        yt-dlp wrote, or the given title.
+        """
+        if journal_id is None:
+            journal_id = self.journal.add(url, title, types, settings)
+        token = CancelToken()
+        with self._jobs_lock:
+            self._job_tokens[journal_id] = token
+            self.jobs[journal_id] = {
+                "id": journal_id, "url": url, "title": title, "types": list(types), "state": "queued",
+                "fraction": 0.0, "status": None, "details": None, "error": None, "downloaded_bytes": 0,
+                "created": time.time(), "updated": time.time()
+            }
+            # Forget the oldest finished jobs
+            finished = [job_id for job_id, job in self.jobs.items() if job["state"] in self.FINISHED_STATES]
+            for job_id in finished[:max(0, len(finished) - self.job_history_size)]:
+                del self.jobs[job_id]
+        self.update_job(journal_id)
+
+        def progress(fraction, text, details=None):
+            fields = {"details": details} if details is not None else {}
+            if fraction is not None:
+                fields["fraction"] = fraction
+            if text is not None:
+                fields["status"] = text
+            self.update_job(journal_id, **fields)
+
+        def run():
+            started = time.monotonic()
+            stats = {}
+            if token.cancelled:
+                success, error = False, "Cancelled"
+            else:
+                self.update_job(journal_id, state="running")
+                self.journal.set_state(journal_id, "running")
+                self.log(f"Starting job: {title}")
+                try:
+                    success = self.download_with_types(url, types, settings, progress=progress, stats=stats,
+                                                       cancel_token=token)
+                    error = None if success else stats.get("error")
+                except Exception as e:
+                    self.log(f"Error: {str(e)}")
+                    error = str(e)
+                    success = False
+
+            if token.cancelled:
+                state, error = "cancelled", "Cancelled"
+            else:
+                state = "done" if success else "failed"
+            if not self.restarting:
+                self.journal.set_state(journal_id, state, error)
+            with self._jobs_lock:
+                self._job_tokens.pop(journal_id, None)
+            result = {
+                "success": success,
+                "error": error,
+                "title": stats.get("title") or title,
+                "downloaded_bytes": stats.get("downloaded_bytes", 0),
+                "seconds": time.monotonic() - started
+            }
+            self.update_job(journal_id, state=state, error=error, title=result["title"],
+                            downloaded_bytes=result["downloaded_bytes"], **({"fraction": 1.0} if success else {}))
+            return result
+
+        future = self.scheduler.submit(run, get_host_key(url))
+        future.job_id = journal_id
+        return future
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job, killing its yt-dlp process; False if it is not active"""
+        with self._jobs_lock:
+            token = self._job_tokens.get(job_id)
+            if token is None or token.cancelled:
+                return False
+            job = self.jobs[job_id]
+        token.cancel()
+        self.log(f"Cancelled job: {job['title']}")
+        if job["state"] == "queued":
+            # It still goes through the scheduler, but finishes without starting yt-dlp
+            self.journal.set_state(job_id, "cancelled", "Cancelled")
+            self.update_job(job_id, state="cancelled", error="Cancelled")
+        return True
+
+    def add_job_listener(self, listener):
+        """Call listener(job) with a copy of a job whenever it is queued or changes (from any thread)"""
+        self._job_listeners.append(listener)
+
+    def remove_job_listener(self, listener):
+        if listener in self._job_listeners:
+            self._job_listeners.remove(listener)
+
+    def update_job(self, job_id, **fields):
+        """Change fields of a job and pass a copy of it to the job listeners"""
+        with self._jobs_lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields, updated=time.time())
+            job = dict(job)
+        for listener in list(self._job_listeners):
+            try:
+                listener(job)
+            except Exception as e:
+                self.log(f"Job listener failed: {str(e)}")
+
+    def list_jobs(self):
+        """Copies of the jobs of this session in submission order"""
+        with self._jobs_lock:
+            return [dict(job) for job in self.jobs.values()]
+
+    def get_job(self, job_id):
+        """Copy of one job, or None"""
+        with self._jobs_lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stop_downloads(self):
+        """Stop all running downloads, leaving them unfinished in the journal (before a restart)"""
+        self.restarting = True
+        for process in list(self.download_processes):
+            process.terminate()
+
+    def build_download_command(self, url, download_types, settings, write_info_json=None):
+        """yt-dlp command for one run writing download_types; returns (command, media type or None)"""
+        download_path = settings.get("download_path") or str(Path.home() / "Downloads")
+        output_template = os.path.join(download_path, "%(title)s.%(ext)s")
+        cmd = get_ytdlp_command() + ["-o", output_template]
+
+        # Add cookie options if enabled
+        if settings.get("cookies_from_browser"):
+            cmd.extend(["--cookies-from-browser", settings["cookies_from_browser"]])
+            self.log(f"Using cookies from: {settings['cookies_from_browser']}")
+
+        # Video or audio at most one of them, plus thumbnail/subtitle files
+        if "video" in download_types:
+            media_type = "video"
+        elif "audio" in download_types:
+            media_type = "audio"
+        else:
+            media_type = None
+
+        # Add format options
+        if "subtitle" in download_types:
+            # Subtitle download
+            subtitle_format = settings.get("subtitle_format") or "srt"
+            subtitle_language = settings.get("subtitle_language") or "en"
+            cmd.extend(["--write-subs", "--write-auto-subs"])
+            cmd.extend(["--sub-format", subtitle_format])
+            cmd.extend(["--convert-subs", subtitle_format])
+            cmd.extend(["--sub-langs", subtitle_language])
+            self.log(f"Format: Subtitle ({subtitle_format}, language: {subtitle_language})")
+
+        if "thumbnail" in download_types:
+            # Thumbnail file (kept even when it is also embedded)
+            cmd.extend(["--write-thumbnail"])
+            self.log("Format: Thumbnail" if media_type else "Format: Thumbnail only")
+
+        bitrate = settings.get("audio_bitrate")
+        if media_type is None:
+            cmd.extend(["--skip-download"])
+
+        elif media_type == "audio":
+            # Audio download
+            audio_format = settings.get("audio_format") or "mp3"
+            cmd.extend(["-x", "--audio-format", audio_format])
+            if bitrate:
+                cmd.extend(["--audio-quality", f"{bitrate}K"])
+
+            self.log(f"Format: Audio only")
+            self.log(f"Audio Format: {audio_format.upper()}")
+            self.log(f"Audio Quality: {f'{bitrate} kbps' if bitrate else 'best'}")
+
+        else:
+            # Video download - build format string with individual settings
+            height = settings.get("video_height")
+            cmd.extend(["-f", build_format_string(height, settings.get("video_codec"), bitrate)])
+
+            # Set container format
+            container = settings.get("video_container") or "mp4"
+            cmd.extend(["--merge-output-format", container])
+            # Add remux to ensure format conversion if needed
+            cmd.extend(["--remux-video", container])
+
+            # Log settings
+            self.log(f"Format: Video")
+            self.log(f"Quality: {f'{height}p' if height else 'best'}")
+            self.log(f"Video Codec: {settings.get('video_codec') or 'any'}")
+            self.log(f"Audio Bitrate: {f'{bitrate} kbps' if bitrate else 'best'}")
+            self.log(f"Container: {container.upper()}")
+
+        # Add embed options (for video and audio only)
+        if media_type is not None:
+            if settings.get("embed_thumbnail"):
+                cmd.extend(["--embed-thumbnail"])
+                self.log("Embedding thumbnail")
+
+            if settings.get("embed_metadata"):
+                cmd.extend(["--embed-metadata"])
+                self.log("Embedding metadata")
+
+        # Download engine: parallel DASH/HLS fragments, chunked HTTP requests, external downloader
+        if media_type is not None:
+            external_downloader = settings.get("external_downloader") or self.external_downloader
+            if external_downloader not in ("", "native") and not self.tools.available(external_downloader):
+                self.log(f"{external_downloader} not found - using the built-in downloader")
+                external_downloader = "native"
+            engine_args = get_download_engine_args(
+                settings.get("concurrent_fragments") or self.concurrent_fragments,
+                settings.get("http_chunk_size", self.http_chunk_size),
+                external_downloader,
+                self.external_downloader_args
+            )
+            if engine_args:
+                cmd.extend(engine_args)
+                self.log(f"Download engine: {' '.join(engine_args)}")
+
+        # Save the info of this run so the other runs for this URL can skip extraction
+        if write_info_json:
+            cmd.extend(["--write-info-json", "-o", f"infojson:{write_info_json}"])
+
+        # Merging, remuxing, audio extraction, subtitle conversion and embedding all run ffmpeg
+        if not self.ffmpeg_warned and not self.tools.available("ffmpeg"):
+            self.ffmpeg_warned = True
+            self.log("ffmpeg not found - merging, converting and embedding will fail")
+
+        # Add progress and other options
+        cmd.extend(["--newline", "--no-playlist"])
+        progress_delta = self.progress_delta if self.tools.has_feature("yt-dlp", "progress-delta") else None
+        cmd.extend(get_progress_args(progress_delta))
+
+        # "--" ends the options, so a URL starting with "-" is never read as one
+        cmd.extend(["--", url])
+
+        self.log(f"Download location: {download_path}")
+        return cmd, media_type
+
+    def download(self, url, download_types, settings, info_json=None, write_info_json=None, stats=None,
+                 progress=None, cancel_token=None):
+        """Download url with one yt-dlp run writing download_types (see plan_download_jobs).
+
+        info_json starts the run from an info file instead of the stored
+        analysis, write_info_json saves the info of this run to
+        "<write_info_json>.info.json", and stats receives the measured
+        extraction time, downloaded bytes, phase timings, title and error. progress(fraction,
+        text, details) receives the parsed progress dict (bytes, speed, ETA,
+        fragment, stage, see parse_progress_line) as details. cancel_token kills
+        the yt-dlp process when its job is cancelled.
+        """
+        def report(fraction=None, text=None, details=None):
+            if progress is not None:
+                progress(fraction, text, details)
+
+        try:
+            self.log(f"Starting download: {url}")
+            report(0)
+
+            cmd, media_type = self.build_download_command(url, download_types, settings, write_info_json)
+            self.log("Processing...")
+
+            # Start from the info dict kept at analysis time so yt-dlp skips re-extraction;
+            # if it is gone, stale or rejected, fall back to the URL
+            commands = [cmd]
+            info_json_path = None  # temp file exported from the store, removed after the run
+            load_path = info_json if info_json and os.path.exists(info_json) else None
+            if load_path:
+                self.log("Using info-json shared with the other download types (skipping extraction)")
+            elif self.reuse_info_json:
+                info_json_path = load_path = self.info_json_store.export(get_video_key(url))
+                if load_path:
+                    self.log("Using info-json from analysis (skipping extraction)")
+            if load_path:
+                url_index = cmd.index("--")
+                commands.insert(0, cmd[:url_index] + ["--load-info-json", load_path] + cmd[url_index + 2:])
+
+            # Bandwidth budget: media runs hold a share of the global rate while they download
+            budget_job = None
+            rate = {"current": None, "target": None}
+            if media_type is not None and self.bandwidth_budget.enabled:
+                budget_job = object()
+                rate["current"] = rate["target"] = self.bandwidth_budget.acquire(
+                    budget_job, lambda share: rate.update(target=share)
+                )
+
+            # Metrics: seconds spent in each phase over all runs of this download
+            phases = dict.fromkeys(MetricsStore.PHASES, 0.0)
+            phase = {"name": None, "since": 0.0}
+            peak_speed = None
+            title = None
+            run_started, run_clock = time.time(), time.monotonic()
+
+            def enter_phase(name):
+                now = time.monotonic()
+                if phase["name"] is not None:
+                    phases[phase["name"]] += now - phase["since"]
+                phase.update(name=name, since=now)
+
+            try:
+                for attempt, cmd in enumerate(commands):
+                    extraction_time = None
+                    downloaded_bytes = 0
+                    while True:
+                        run_cmd = cmd
+                        if rate["current"] is not None:
+                            run_cmd = add_options(cmd, ["--limit-rate", format_rate(rate["current"])])
+                        self.log(f"Command: {' '.join(run_cmd)}")
+                        started = time.monotonic()
+                        errors = []
+                        rebalance = False
+
+                        # Execute command
+                        process = subprocess.Popen(
+                            run_cmd,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT
+                        )
+                        self.download_processes.add(process)
+                        if cancel_token is not None:
+                            cancel_token.register(process)
+                        enter_phase("extract")
+
+                        # Read output in chunks - progress arrives as JSON lines (see PROGRESS_TEMPLATES)
+                        for line in iter_output_lines(process.stdout):
+                            line = line.strip()
+                            if line:
+                                # Extraction is over once yt-dlp starts working on the formats/files
+                                if extraction_time is None and line.startswith(("[info]", "[download]", PROGRESS_PREFIX)):
+                                    extraction_time = time.monotonic() - started
+                                if line.startswith("ERROR:"):
+                                    errors.append(line)
+                                if title is None and line.startswith("[download] Destination: "):
+                                    # "<title>.<ext>", or "<title>.f<format id>.<ext>" for separate streams
+                                    title = re.sub(r"\.f[\w-]+$", "", Path(line.split(": ", 1)[1]).stem)
+                                details = parse_progress_line(line)
+                                if details is None:
+                                    self.log(line)
+                                    continue
+
+                                if details["stage"] == "download":
+                                    current = "download"
+                                    if details.get("speed"):
+                                        peak_speed = max(peak_speed or 0, details["speed"])
+                                else:
+                                    current = "merge" if details.get("postprocessor") == "Merger" else "postprocess"
+                                if phase["name"] != current:
+                                    enter_phase(current)
+
+                                text = format_progress(details)
+                                report(details.get("fraction"), text, details)
+                                if details["status"] == "finished" and details["stage"] == "download":
+                                    downloaded_bytes += details.get("downloaded") or 0
+                                if details["stage"] == "download":
+                                    self.log(f"[download] {text}")
+                                    if budget_job is not None and not rebalance:
+                                        if self.should_rebalance(rate, started):
+                                            # --limit-rate is fixed per process - stop it and resume from the .part files
+                                            rebalance = True
+                                            process.terminate()
+
+                        process.wait()
+                        self.download_processes.discard(process)
+                        if cancel_token is not None:
+                            cancel_token.unregister(process)
+                        enter_phase(None)
+                        if not rebalance:
+                            break
+                        rate["current"] = rate["target"]
+                        self.log(f"Bandwidth rebalanced - resuming at {format_rate(rate['current'])}/s")
+
+                    if stats is not None:
+                        stats["extracted"] = "--load-info-json" not in cmd
+                        stats["extraction_time"] = extraction_time
+                        stats["downloaded_bytes"] = downloaded_bytes
+                        stats["phases"] = phases
+                        stats["title"] = title
+                        stats["error"] = errors[-1] if process.returncode != 0 and errors else None
+
+                    if process.returncode == 0 or attempt == len(commands) - 1:
+                        break
+                    if cancel_token is not None and cancel_token.cancelled:
+                        break
+                    # Only expired/rejected format URLs are fixed by extracting again
+                    if not any(re.search(r"HTTP Error (403|404|410)|expired", error) for error in errors):
+                        break
+                    self.log("Download from stored info-json failed - extracting the URL again")
+            finally:
+                if budget_job is not None:
+                    self.bandwidth_budget.release(budget_job)
+                if info_json_path:
+                    try:
+                        os.remove(info_json_path)
+                    except OSError:
+                        pass
+
+            cancelled = cancel_token is not None and cancel_token.cancelled
+            if self.collect_metrics and not cancelled:
+                try:
+                    self.metrics.record(
+                        url, title or url, self.get_download_profile(media_type or download_types[0], settings),
+                        process.returncode == 0, run_started, phases, time.monotonic() - run_clock,
+                        downloaded_bytes, peak_speed
+                    )
+                except sqlite3.Error as e:
+                    self.log(f"Failed to record download metrics: {str(e)}")
+
+            if process.returncode == 0:
+                report(1.0)
+                self.log("Download completed successfully!")
+                return True
+            else:
+                self.log("Download cancelled" if cancelled else "Download failed!")
+                return False
+
+        except Exception as e:
+            self.log(f"Error: {str(e)}")
+            return False
+
+
+def read_urls(path):
+    """URLs from a file (one per line, # comments allowed) or from stdin for "-" """
+    if path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    lines = (line.strip() for line in text.splitlines())
+    return dedupe_urls([line for line in lines if line and not line.startswith("#")])
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    """Requests of a ControlServer (set as the control attribute of a subclass)"""
+
+    control = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_api("GET")
+
+    def do_POST(self):
+        self.handle_api("POST")
+
+    def do_DELETE(self):
+        self.handle_api("DELETE")
+
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def authorized(self):
+        """Refuse requests made by web pages (Origin header, DNS rebinding) and check the token"""
+        host = (self.headers.get("Host") or "").rsplit(":", 1)[0]
+        if self.headers.get("Origin") or host not in ("127.0.0.1", "localhost"):
+            return False
+        token = self.control.token
+        return not token or hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}")
+
+    def read_json(self):
+        """JSON object of the request body; ValueError if it is not one"""
+        if self.headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+            raise ValueError("Content-Type must be application/json")
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("Request body must be a JSON object")
+        return body
+
+    def handle_api(self, method):
+        if not self.authorized():
+            self.send_json(403, {"error": "Forbidden"})
+            return
+
+        engine = self.control.engine
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        try:
+            if parts[0] != "api" or len(parts) < 2:
+                raise LookupError(url.path)
+            route = (method, parts[1], len(parts))
+
+            if route == ("GET", "jobs", 2):
+                self.send_json(200, {"jobs": engine.list_jobs()})
+            elif route == ("POST", "jobs", 2):
+                self.send_json(202, self.control.enqueue(self.read_json()))
+            elif route == ("GET", "jobs", 3):
+                job = engine.get_job(int(parts[2]))
+                if job is None:
+                    raise LookupError(url.path)
+                self.send_json(200, job)
+            elif route == ("DELETE", "jobs", 3):
+                job_id = int(parts[2])
+                if engine.get_job(job_id) is None:
+                    raise LookupError(url.path)
+                self.send_json(200, {"cancelled": engine.cancel(job_id)})
+            elif route == ("GET", "analysis", 2):
+                video_url = (parse_qs(url.query).get("url") or [""])[0]
+                if not is_web_url(video_url):
+                    raise ValueError("url parameter must be an http(s) URL")
+                try:
+                    self.send_json(200, engine.analyze_url(video_url))
+                except AnalysisError as e:
+                    self.send_json(502, {"error": str(e)})
+            elif route == ("GET", "events", 2):
+                self.stream_events()
+            else:
+                raise LookupError(url.path)
+        except LookupError:
+            self.send_json(404, {"error": "Not found"})
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+    def stream_events(self):
+        """Send every job as a server-sent event, then each change until the client disconnects"""
+        events = queue.Queue()
+        engine = self.control.engine
+        engine.add_job_listener(events.put)
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            for job in engine.list_jobs():
+                events.put(job)
+            while True:
+                try:
+                    job = events.get(timeout=self.control.keepalive)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                else:
+                    data = json.dumps(job, ensure_ascii=False)
+                    self.wfile.write(f"event: job\ndata: {data}\n\n".encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            engine.remove_job_listener(events.put)
+
+
+class ControlServer:
+    """Opt-in HTTP/JSON API on 127.0.0.1 for queueing and monitoring downloads from other programs.
+
+        GET    /api/jobs              jobs of this session
+        GET    /api/jobs/<id>         one job
+        POST   /api/jobs              {"urls": [...], <profile options>} - queue downloads (in the background)
+        DELETE /api/jobs/<id>         cancel a queued or running job
+        GET    /api/analysis?url=URL  analysis of a URL (from the analysis cache when possible)
+        GET    /api/events            job changes as server-sent events
+
+    Profile options are those of the headless mode (see PROFILE_DEFAULTS);
+    defaults() can override their defaults, e.g. with the GUI's download
+    folder. Only http(s) URLs are accepted, and output/cookies_from_browser
+    only when a token is configured. Jobs go through the engine's queue, journal and archive like
+    the ones started from the GUI.
+    """
+
+    PROTECTED_OPTIONS = ("output", "cookies_from_browser")
+
+    def __init__(self, engine, port=8765, token="", defaults=None):
+        self.engine = engine
+        self.token = token
+        self.defaults = defaults or dict
+        self.keepalive = 15  # seconds between keepalive comments on idle event streams
+        handler = type("Handler", (ControlRequestHandler,), {"control": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def enqueue(self, request):
+        """Validate a POST /api/jobs request and queue its URLs in the background.
+
+        Expanding playlists/channels can take minutes, so the jobs are not
+        known yet when this returns; they show up in /api/jobs and /api/events.
+        """
+        urls = request.get("urls") or ([request["url"]] if request.get("url") else [])
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls) or not urls:
+            raise ValueError("urls must be a non-empty list of URLs")
+        invalid = [url for url in urls if not is_web_url(url)]
+        if invalid:
+            raise ValueError(f"Not an http(s) URL: {invalid[0]}")
+        # Without a token any local program can call the API - it may not pick folders or browser cookies
+        if not self.token:
+            refused = [name for name in self.PROTECTED_OPTIONS if request.get(name)]
+            if refused:
+                raise ValueError(f"{', '.join(refused)} needs control_api_token to be set")
+        options = dict(self.defaults())
+        options.update((name, request[name]) for name in PROFILE_DEFAULTS if name in request)
+        types, settings = get_profile_settings(options)
+
+        def enqueue_thread():
+            try:
+                items = self.engine.enqueue(dedupe_urls(urls), types, settings)
+            except Exception as e:
+                self.engine.log(f"Control API: queueing failed: {str(e)}")
+                return
+            skipped = sum(item["future"] is None for item in items)
+            self.engine.log(f"Control API: queued {len(items) - skipped} download(s), "
+                            f"{skipped} already in the download archive")
+
+        self.engine.log(f"Control API: queueing {len(urls)} URL(s)")
+        thread = threading.Thread(target=enqueue_thread)
+        thread.daemon = True
+        thread.start()
+        return {"accepted": urls}
+
+
+# Profile options of headless runs and control API requests, with their defaults
+PROFILE_DEFAULTS = {
+    "types": ["video"],
+    "output": None,
+    "quality": "best",
+    "codec": "any",
+    "container": "mp4",
+    "audio_format": "mp3",
+    "audio_bitrate": "best",
+    "subtitle_format": "srt",
+    "subtitle_language": "en",
+    "embed_thumbnail": False,
+    "embed_metadata": False,
+    "cookies_from_browser": None
+}
+
+
+def get_profile_settings(options):
+    """Download types and settings (see DownloadEngine) from profile options; ValueError if they are invalid"""
+    options = dict(PROFILE_DEFAULTS, **{k: v for k, v in options.items() if v is not None})
+
+    def limit(text):
+        text = str(text)
+        if text in ("", "best"):
+            return None
+        if not text.rstrip("pPkK").isdigit():
+            raise ValueError(f"Invalid limit: {text}")
+        return text.rstrip("pPkK")
+
+    types = options["types"]
+    if isinstance(types, str) or not set(types) <= set(DOWNLOAD_TYPES):
+        raise ValueError(f"types must be a list of {', '.join(DOWNLOAD_TYPES)}")
+    if options["codec"] != "any" and options["codec"] not in VIDEO_CODECS:
+        raise ValueError(f"codec must be any, {', '.join(VIDEO_CODECS)}")
+    for name in ("container", "audio_format", "subtitle_format", "subtitle_language"):
+        if not re.match(r"^[\w.,*-]+$", str(options[name])) or str(options[name]).startswith("-"):
+            raise ValueError(f"Invalid {name}: {options[name]}")
+
+    output = options["output"]
+    settings = {
+        "download_path": os.path.abspath(os.path.expanduser(output)) if output else None,
+        "video_height": limit(options["quality"]),
+        "video_codec": None if options["codec"] == "any" else options["codec"],
+        "audio_bitrate": limit(options["audio_bitrate"]),
+        "video_container": options["container"],
+        "audio_format": options["audio_format"],
+        "subtitle_format": options["subtitle_format"],
+        "subtitle_language": options["subtitle_language"],
+        "embed_thumbnail": bool(options["embed_thumbnail"]),
+        "embed_metadata": bool(options["embed_metadata"]),
+        "cookies_from_browser": options["cookies_from_browser"]
+    }
+    return [t for t in DOWNLOAD_TYPES if t in types], settings
+
+
+def parse_headless_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="youtube_downloader.py --headless",
+        description="IB YouTube Downloader - download a list of URLs without the GUI and report the results as JSON"
+    )
+    parser.add_argument("urls_file", help="File with one URL per line, or - to read from stdin")
+    parser.add_argument("--types", nargs="+", choices=DOWNLOAD_TYPES, help="What to download (default: video)")
+    parser.add_argument("-o", "--output", help="Download folder (default: ~/Downloads)")
+    parser.add_argument("--quality", help="Maximum video height, e.g. 1080 (default: best)")
+    parser.add_argument("--codec", choices=("any",) + tuple(VIDEO_CODECS), help="Video codec (default: any)")
+    parser.add_argument("--container", help="Video container (default: mp4)")
+    parser.add_argument("--audio-format", help="Audio format (default: mp3)")
+    parser.add_argument("--audio-bitrate", help="Maximum audio bitrate in kbps (default: best)")
+    parser.add_argument("--subtitle-format", help="Subtitle format (default: srt)")
+    parser.add_argument("--subtitle-language", help="Subtitle language (default: en)")
+    parser.add_argument("--embed-thumbnail", action="store_true", help="Embed the thumbnail into the media file")
+    parser.add_argument("--embed-metadata", action="store_true", help="Embed metadata into the media file")
+    parser.add_argument("--cookies-from-browser", metavar="BROWSER[:PROFILE]", help="Use cookies from a browser")
+    parser.add_argument("--max-concurrent", type=int, help="Downloads at once (default: max_concurrent_downloads)")
+    parser.add_argument("--per-host", type=int, help="Downloads at once per site (default: max_downloads_per_host)")
+    parser.add_argument("--no-archive", action="store_true", help="Download items already in the download archive")
+    parser.add_argument("--config", help="config.json to read settings from (default: the GUI's config.json)")
+    return parser.parse_args(argv)
+
+
+def run_headless(argv):
+    """Download the URLs of a file with the GUI's engine and settings; print a JSON report, return the exit code"""
+    args = parse_headless_args(argv)
+    try:
+        types, settings = get_profile_settings({name: getattr(args, name) for name in PROFILE_DEFAULTS})
+    except ValueError as e:
+        print(f"Invalid options: {e}", file=sys.stderr)
+        return 2
+
+    config_file = Path(args.config) if args.config else get_config_path()
+    # Caches, journal and archive are stored next to the config file
+    if not config_file.parent.is_dir():
+        print(f"Config folder does not exist: {config_file.parent}", file=sys.stderr)
+        return 2
+    config = load_config(config_file)
+    if args.max_concurrent is not None:
+        config["max_concurrent_downloads"] = args.max_concurrent
+    if args.per_host is not None:
+        config["max_downloads_per_host"] = args.per_host
+    if args.no_archive:
+        config["use_download_archive"] = False
+
+    # Logs go to stderr so stdout only carries the JSON report
+    log_lock = threading.Lock()
+
+    def log(message):
+        with log_lock:
+            print(message, file=sys.stderr, flush=True)
+
+    engine = DownloadEngine(config, config_file.parent, log=log,
+                            cookies_from_browser=lambda: args.cookies_from_browser)
+
+    try:
+        urls = read_urls(args.urls_file)
+    except OSError as e:
+        log(f"Cannot read {args.urls_file}: {e}")
+        return 2
+
+    started = time.monotonic()
+    items = engine.enqueue(urls, types, settings)
+    scheduler = engine.scheduler
+    log(f"Queued {sum(item['future'] is not None for item in items)} download(s) - "
+        f"up to {scheduler.max_concurrent} at once, {scheduler.per_host} per site")
+
+    results = []
+    try:
+        for item in items:
+            future = item.pop("future")
+            if future is None:
+                item.update(status="skipped", success=True)
+            else:
+                outcome = future.result()
+                item.update(outcome, status="done" if outcome["success"] else "failed")
+            results.append(item)
+    except KeyboardInterrupt:
+        # Interrupted jobs stay unfinished in the journal and are offered for resume by the GUI
+        engine.stop_downloads()
+        log("Interrupted - unfinished downloads can be resumed later")
+        return 130
+
+    report = {
+        "success": all(result["success"] for result in results),
+        "total": len(results),
+        "downloaded": sum(result["status"] == "done" for result in results),
+        "skipped": sum(result["status"] == "skipped" for result in results),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "seconds": round(time.monotonic() - started, 3),
+        "results": results
+    }
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 0 if report["success"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_headless(sys.argv[1:]))
@@ -0,0 +1,40 @@
+import random
+import time
+
+from downloader_core import BandwidthBudget, DownloadEngine
+
+
+def run_jobs(engine, budget, events):
+    """Start (True) or finish (False) jobs in order, rebalancing after each event the way download() does.
+
+    After every event the combined --limit-rate of the running jobs must fit the budget.
+    """
+    jobs = {}  # job id -> {"current", "target"} as kept by DownloadEngine.download
+    started = time.monotonic()  # every run is still within bandwidth_rebalance_interval
+    for job_id, start in enumerate(events):
+        if start:
+            rate = {}
+            rate["current"] = rate["target"] = budget.acquire(job_id, lambda share, rate=rate: rate.update(target=share))
+            jobs[job_id] = rate
+        elif jobs:
+            finished = next(iter(jobs))
+            budget.release(finished)
+            del jobs[finished]
+
+        for rate in jobs.values():
+            if engine.should_rebalance(rate, started):
+                rate["current"] = rate["target"]
+        assert sum(rate["current"] for rate in jobs.values()) <= budget.rate
+    return jobs
+
+
+def test_shares_fit_budget_as_jobs_start(tmp_path):
+    engine = DownloadEngine({}, tmp_path)
+    jobs = run_jobs(engine, BandwidthBudget(1200 * 1000), [True] * 4)
+    assert [rate["current"] for rate in jobs.values()] == [300 * 1000] * 4
+
+
+def test_shares_fit_budget_as_jobs_start_and_finish(tmp_path):
+    engine = DownloadEngine({}, tmp_path)
+    events = [random.Random(seed).random() < 0.6 for seed in range(200)]
+    run_jobs(engine, BandwidthBudget(1000 * 1024), events)
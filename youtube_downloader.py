@@ -1,5 +1,10 @@
+import time
+
+# Taken before the other imports, so --startup-profile includes them
+STARTUP_TIME = time.perf_counter()
+
 import customtkinter as ctk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, Canvas
 import os
 import sys
 import threading
@@ -7,10 +12,16 @@ import subprocess
 import json
 import re
 import platform
-import tempfile
 import shutil
+import tempfile
+from collections import OrderedDict
 from pathlib import Path
-from urllib.request import urlretrieve
+
+from downloader_core import (
+    AnalysisError, AnalysisCancelled, CancelToken, ControlServer, DownloadEngine, LogPipeline, ThumbnailStore,
+    DOWNLOAD_TYPES, EXTERNAL_DOWNLOADERS, dedupe_urls, format_duration, format_rate, get_config_path, get_video_key,
+    get_ytdlp_command, is_collection_url, load_config, run_headless, warm_extractor_matching
+)
 try:
     from PIL import Image
     from io import BytesIO
@@ -139,15 +150,106 @@ class BrowserDetector:
         return profiles if profiles else ["Default"]
 
 
-class YouTubeDownloaderGUI:
+class UIEventBus:
+    """Typed UI events posted from any thread and applied on the Tk main loop.
+
+    Workers post(kind, key, **fields) instead of touching widgets; post()
+    only queues, it never calls into Tk. start() runs a loop on the main
+    thread that applies pending events in posting order once per frame
+    (interval ms) with the handler subscribed for their kind. Events with a key are coalesced:
+    a newer event for the same (kind, key) merges its fields into the
+    pending one, so fifty progress lines of one job within a frame become
+    a single widget update. Events without a key (appended text) are all
+    applied.
+    """
+
+    def __init__(self, schedule, interval=16):
+        self._schedule = schedule  # schedule(delay_ms, callback), e.g. window.after
+        self.interval = interval
+        self._handlers = {}
+        self._pending = OrderedDict()  # (kind, key or sequence number) -> fields
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self.posted = 0
+        self.applied = 0
+
+    def subscribe(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def post(self, kind, key=None, **fields):
+        """Queue an event - safe to call from any thread"""
+        with self._lock:
+            self.posted += 1
+            if key is None:
+                self._sequence += 1
+                self._pending[(kind, None, self._sequence)] = fields
+            elif (kind, key) in self._pending:
+                self._pending[(kind, key)].update(fields)
+            else:
+                self._pending[(kind, key)] = dict(fields)
+
+    def start(self):
+        """Apply pending events every interval ms (call once, on the main thread)"""
+        # Scheduled first so a handler opening a modal dialog does not stall the other events
+        self._schedule(self.interval, self.start)
+        self.flush()
+
+    def flush(self):
+        """Apply all pending events (main thread)"""
+        with self._lock:
+            if not self._pending:
+                return
+            events, self._pending = self._pending, OrderedDict()
+            self.applied += len(events)
+
+        for slot, fields in events.items():
+            try:
+                self._handlers[slot[0]](**fields)
+            except Exception as e:
+                print(f"UI event {slot[0]} failed: {e}")
+
+
+class StartupProfile:
+    """Time spent in each startup phase, from STARTUP_TIME to the first paint of the window"""
+
     def __init__(self):
+        self.phases = []  # [(name, seconds), ...]
+        self._last = STARTUP_TIME
+
+    def mark(self, phase):
+        """End the current phase"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - STARTUP_TIME
+
+    def report(self):
+        """Phase breakdown and time to first paint as text"""
+        lines = ["Startup profile:"]
+        lines.extend(f"  {name:<20} {seconds * 1000:8.1f} ms" for name, seconds in self.phases)
+        lines.append(f"  {'time to first paint':<20} {self.total * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+class YouTubeDownloaderGUI:
+    def __init__(self, startup_profile=False):
+        # Startup timings - printed and the app closed after the first paint with --startup-profile
+        self.startup = StartupProfile()
+        self.startup.mark("imports")
+        self.print_startup_profile = startup_profile
+
         self.window = ctk.CTk()
+        self.startup.mark("window")
 
         # Load config and initialize language manager
         self.config = self.load_config()
         self.lang = LanguageManager(self.config.get("language", "ko"))
 
         self.window.title(self.lang.get("app_title"))
+        self.startup.mark("config")
 
         # Default download path
         self.download_path = str(Path.home() / "Downloads")
@@ -157,36 +259,144 @@ class YouTubeDownloaderGUI:
         self.max_height = None
         self.max_audio_bitrate = None
 
-        # Auto-analysis flag
-        self.auto_analyzing = False
-        self.last_url = ""
-
-        # Thumbnail cache
-        self.thumbnail_cache_dir = Path(tempfile.gettempdir()) / "ytdlp_gui_thumbnails"
-        self.thumbnail_cache_dir.mkdir(exist_ok=True)
-        self.thumbnail_cache = {}  # url -> (local_path, ctk_image)
-
-        # Video analysis cache - stores analysis results to avoid re-analyzing
-        self.video_analysis_cache = {}  # url -> video_info dict
+        # Log pipeline - lines from any thread are queued and shown in batches; full log in logs/downloader.log
+        self.log_max_lines = max(1, int(self.config.get("log_max_lines", 2000)))
+        self.log_flush_interval = max(10, int(self.config.get("log_flush_interval", 100)))
+        self.log_pipeline = LogPipeline(
+            self.get_data_dir() / "logs" / "downloader.log",
+            max_bytes=int(self.config.get("log_file_size", 5 * 1024 * 1024)),
+            backups=int(self.config.get("log_file_backups", 3))
+        )
 
-        # Detect installed browsers
-        self.browsers = BrowserDetector.detect_browsers()
-        self.browser_profiles = {}
+        # UI event bus - worker threads post widget updates, the main loop applies them once per frame
+        self.ui_events = UIEventBus(self.window.after, int(self.config.get("ui_frame_interval", 16)))
+        self._quality_values = None  # last (video, audio) quality options shown in the menus
+
+        # Auto-analysis state - edits are debounced and a newer URL set cancels the running analysis
+        self.last_url_set = ()
+        self.url_matching_ready = threading.Event()  # set once yt-dlp's URL patterns are loaded (see on_first_paint)
+        self.auto_analyze_delay = int(self.config.get("auto_analyze_delay", 500))
+        self._auto_analyze_after_id = None
+        self._coalesced_edits = 0
+        self._analysis_token = None
+
+        # Thumbnail cache - files on disk (kept across restarts), decoded images in a bounded LRU
+        self.thumbnail_store = ThumbnailStore(
+            self.get_data_dir() / "thumbnails",
+            max_bytes=float(self.config.get("thumbnail_cache_mb", 50)) * 1024 * 1024
+        )
+        self.thumbnail_cache = OrderedDict()  # video key -> (local_path, ctk_image), least recently used first
+        self.thumbnail_memory_size = max(1, int(self.config.get("thumbnail_memory_size", 200)))
+        self.thumbnail_lock = threading.Lock()
+
+        # Download engine - analysis, download queue, journal, archive and metrics (shared with --headless)
+        self.cookie_browser = None  # get_cookie_browser() as of the last change of the cookie widgets
+        self.engine = DownloadEngine(self.config, self.get_data_dir(), log=self.log_message,
+                                     cookies_from_browser=lambda: self.cookie_browser)
+        self.engine.on_thumbnail = self.download_and_cache_thumbnail
+        self.job_rows = {}  # job id -> (row_frame, progress_bar, status_label)
+        self.job_progress = {}  # job id -> fraction done
+        self.job_states = {}  # job id -> "queued" / "running" / "done" / "failed" / "cancelled"
+        self.job_details = {}  # job id -> latest parsed progress (bytes, speed, ETA, fragment, stage)
+
+        # Rows analyzed per page when a playlist/channel is expanded in the batch window
+        self.analysis_page_size = max(1, int(self.config.get("analysis_page_size", 20)))
+
+        # Installed browsers - detected in the background after the first paint
+        self.browsers = {}
+        self.browser_profiles = {}  # browser -> profiles
+        self.startup.mark("engine")
 
         # Set responsive window size
         self.set_responsive_size()
 
+        # Initialize UI
+        self.create_widgets()
+        self.startup.mark("widgets")
+
+        # Center window
+        self.center_window()
+        self.startup.mark("layout")
+
+        # Start showing queued log lines
+        self.flush_log()
+
+        # Widget updates posted by worker threads
+        for kind, handler in (
+            ("analysis_status", self.apply_analysis_status),
+            ("quality_options", self.apply_quality_options),
+            ("progress", self.apply_progress),
+            ("overall_progress", self.update_overall_progress),
+            ("browsers_detected", self.apply_browsers),
+            ("engine_job", self.apply_engine_job),
+            ("update_available", self.prompt_update),
+            ("call", lambda callback: callback())
+        ):
+            self.ui_events.subscribe(kind, handler)
+        self.ui_events.start()
+        self.engine.add_job_listener(self.on_engine_job)
+
+        # Opt-in localhost API for queueing and monitoring downloads from other programs
+        self.control_server = None
+        if self.config.get("control_api", False):
+            self.start_control_api()
+
+        # Offer to resume downloads left over from a crash or restart
+        self.window.after(500, self.resume_unfinished_jobs)
+        self.startup.mark("services")
+
+        # The first idle callback of the main loop runs once the window has been drawn
+        self.window.after(0, lambda: self.window.after_idle(self.on_first_paint))
+
+    def on_first_paint(self):
+        """Start the tasks kept off the startup path: browser detection and update checks"""
+        self.startup.mark("first paint")
+        self.log_message(f"Window ready after {self.startup.total * 1000:.0f} ms")
+        if self.print_startup_profile:
+            print(self.startup.report())
+            self.window.quit()
+            return
+
+        self.detect_browsers()
+        self.probe_tools()
+        self.warm_url_matching()
+        self.remove_legacy_thumbnails()
+
         # Check and update yt-dlp
         self.check_ytdlp_update()
 
         # Check for app updates from GitHub
         self.check_app_update()
 
-        # Initialize UI
-        self.create_widgets()
+    def remove_legacy_thumbnails(self):
+        """Delete the unbounded temp-folder thumbnail cache used before the thumbnail store"""
+        legacy_dir = Path(tempfile.gettempdir()) / "ytdlp_gui_thumbnails"
+        if not legacy_dir.exists():
+            return
+        thread = threading.Thread(target=shutil.rmtree, args=(legacy_dir,), kwargs={"ignore_errors": True})
+        thread.daemon = True
+        thread.start()
 
-        # Center window
-        self.center_window()
+    def warm_url_matching(self):
+        """Load yt-dlp's extractor URL patterns in the background so deduplicating typed URLs never blocks the UI"""
+        def warm_thread():
+            warm_extractor_matching()
+            self.url_matching_ready.set()
+
+        thread = threading.Thread(target=warm_thread)
+        thread.daemon = True
+        thread.start()
+
+    def probe_tools(self):
+        """Look up yt-dlp and ffmpeg in the background so the first Download click does not wait for them"""
+        def probe_thread():
+            for name in ("yt-dlp", "ffmpeg"):
+                info = self.engine.tools.get(name)
+                self.log_message(f"{name} {info['version']}" if info else f"{name} not found")
+
+        thread = threading.Thread(target=probe_thread)
+        thread.daemon = True
+        thread.start()
 
     def set_responsive_size(self):
         """Set window size based on screen resolution and DPI scaling"""
@@ -214,23 +424,15 @@ class YouTubeDownloaderGUI:
 
     def get_config_path(self):
         """Get path for config file - writable location"""
-        if getattr(sys, 'frozen', False):
-            # Running as compiled executable - use user home directory
-            config_dir = Path.home() / ".ib_youtube_downloader"
-            config_dir.mkdir(exist_ok=True)
-            return config_dir / "config.json"
-        else:
-            # Running as script - use script directory
-            return Path(__file__).parent / "config.json"
+        return get_config_path()
+
+    def get_data_dir(self):
+        """Get directory for caches and other persistent data (next to config.json)"""
+        return self.get_config_path().parent
 
     def load_config(self):
         """Load configuration from config.json"""
-        config_file = self.get_config_path()
-        try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {"language": "ko"}  # Default config
+        return load_config(self.get_config_path())
 
     def save_config(self):
         """Save configuration to config.json"""
@@ -243,32 +445,36 @@ class YouTubeDownloaderGUI:
 
     def get_ytdlp_command(self):
         """Get yt-dlp command - works in both dev and bundled mode"""
-        if getattr(sys, 'frozen', False):
-            # Running as compiled executable - use Python module
-            return [sys.executable, "-m", "yt_dlp"]
-        else:
-            # Running as script - use yt-dlp command
-            return ["yt-dlp"]
+        return get_ytdlp_command()
+
+    def update_check_due(self, key):
+        """Whether the update check whose last run is stored under key is due; if so record it in config.json"""
+        interval = float(self.config.get("update_check_interval", 24)) * 3600
+        now = time.time()
+        if 0 <= now - float(self.config.get(key, 0)) < interval:
+            return False
+        self.config[key] = now
+        self.save_config()
+        return True
 
     def check_ytdlp_update(self):
-        """Check and update yt-dlp at startup"""
+        """Check and update yt-dlp at most once per update_check_interval hours"""
+        if not self.update_check_due("last_ytdlp_update_check"):
+            return
+
         def update_thread():
             try:
                 # Check if yt-dlp is installed
-                result = subprocess.run(
-                    self.get_ytdlp_command() + ["--version"],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-
-                if result.returncode == 0:
+                if self.check_ytdlp():
                     # Update yt-dlp
-                    subprocess.run(
+                    result = subprocess.run(
                         self.get_ytdlp_command() + ["-U"],
                         capture_output=True,
                         timeout=30
                     )
+                    if result.returncode == 0:
+                        # Probe the new binary on the next check
+                        self.engine.tools.refresh("yt-dlp")
             except:
                 pass
 
@@ -277,13 +483,13 @@ class YouTubeDownloaderGUI:
         thread.start()
 
     def check_app_update(self):
-        """Check for app updates from GitHub main branch"""
+        """Check for app updates from GitHub main branch at most once per update_check_interval hours"""
+        # Check if we're in a git repository
+        if not os.path.exists(".git") or not self.update_check_due("last_app_update_check"):
+            return
+
         def update_check_thread():
             try:
-                # Check if we're in a git repository
-                if not os.path.exists(".git"):
-                    return
-
                 # Fetch latest changes from origin
                 fetch_result = subprocess.run(
                     ["git", "fetch", "origin", "main"],
@@ -307,7 +513,7 @@ class YouTubeDownloaderGUI:
                     commits_behind = status_result.stdout.strip()
                     if commits_behind and int(commits_behind) > 0:
                         # There are updates available
-                        self.window.after(0, lambda: self.prompt_update(commits_behind))
+                        self.ui_events.post("update_available", commits_behind=commits_behind)
 
             except Exception as e:
                 # Silently fail if update check fails
@@ -346,6 +552,8 @@ class YouTubeDownloaderGUI:
                     "업데이트 완료",
                     "업데이트가 완료되었습니다!\n프로그램을 재시작합니다."
                 )
+                # Stop running downloads - they stay in the download journal and resume after the restart
+                self.engine.stop_downloads()
                 # Restart the application
                 python = sys.executable
                 os.execl(python, python, *sys.argv)
@@ -413,6 +621,15 @@ class YouTubeDownloaderGUI:
         )
         add_lang_btn.pack(side="left", padx=2)
 
+        # Download metrics dashboard button
+        metrics_btn = ctk.CTkButton(
+            lang_frame,
+            text="📊",  # Chart icon
+            command=self.open_metrics_dashboard,
+            width=30
+        )
+        metrics_btn.pack(side="left", padx=2)
+
         # URL Frame
         url_frame = ctk.CTkFrame(self.main_frame)
         url_frame.pack(pady=10, padx=20, fill="x")
@@ -473,14 +690,11 @@ class YouTubeDownloaderGUI:
         browser_label = ctk.CTkLabel(cookie_options_frame, text=self.lang.get("browser"), font=ctk.CTkFont(size=12))
         browser_label.grid(row=1, column=0, padx=10, pady=5, sticky="w")
 
-        # Get list of detected browsers or show message
-        browser_list = list(self.browsers.keys()) if self.browsers else [self.lang.get("no_browsers_found")]
-        default_browser = browser_list[0] if browser_list else ""
-
-        self.browser_var = ctk.StringVar(value=default_browser)
+        # Filled in by apply_browsers once detection has finished
+        self.browser_var = ctk.StringVar(value=self.lang.get("detecting_browsers"))
         self.browser_menu = ctk.CTkComboBox(
             cookie_options_frame,
-            values=browser_list,
+            values=[self.lang.get("detecting_browsers")],
             variable=self.browser_var,
             width=150,
             state="disabled",
@@ -501,9 +715,10 @@ class YouTubeDownloaderGUI:
         )
         self.profile_menu.grid(row=2, column=1, padx=10, pady=(5, 10), sticky="w")
 
-        # Load initial profiles
-        if self.browsers and default_browser:
-            self.load_browser_profiles(default_browser)
+        # Analysis and download threads read the cookie setting from self.cookie_browser
+        for var in (self.use_cookies_var, self.browser_var, self.profile_var):
+            var.trace_add("write", self.update_cookie_browser)
+        self.update_cookie_browser()
 
         # Format Selection Frame
         self.format_frame = ctk.CTkFrame(self.main_frame)
@@ -787,6 +1002,10 @@ class YouTubeDownloaderGUI:
         )
         self.progress_label.pack(padx=10, pady=(10, 5))
 
+        # Per-job progress rows, shown while downloads are queued or running
+        self.jobs_frame = ctk.CTkScrollableFrame(self.progress_frame, height=110)
+
+        # Overall progress of all jobs
         self.progress_bar = ctk.CTkProgressBar(self.progress_frame)
         self.progress_bar.pack(padx=10, pady=(0, 10), fill="x")
         self.progress_bar.set(0)
@@ -871,15 +1090,41 @@ class YouTubeDownloaderGUI:
     def on_browser_change(self, choice=None):
         """Handle browser selection change"""
         browser_name = self.browser_var.get()
-        if browser_name and browser_name != self.lang.get("no_browsers_found"):
+        if browser_name in self.browsers:
             self.load_browser_profiles(browser_name)
 
+    def detect_browsers(self):
+        """Detect installed browsers and the profiles of the first one in a background thread"""
+        def detect_thread():
+            started = time.perf_counter()
+            browsers = BrowserDetector.detect_browsers()
+            profiles = {}
+            for browser_name, browser_path in list(browsers.items())[:1]:
+                profiles[browser_name] = BrowserDetector.get_profiles(browser_name, browser_path)
+            self.log_message(f"Detected {len(browsers)} browser(s) in {(time.perf_counter() - started) * 1000:.0f} ms")
+            self.ui_events.post("browsers_detected", browsers=browsers, profiles=profiles)
+
+        thread = threading.Thread(target=detect_thread)
+        thread.daemon = True
+        thread.start()
+
+    def apply_browsers(self, browsers, profiles):
+        """Show the detected browsers in the cookie options"""
+        self.browsers = browsers
+        self.browser_profiles.update(profiles)
+        browser_list = list(browsers) if browsers else [self.lang.get("no_browsers_found")]
+        self.browser_menu.configure(values=browser_list)
+        self.browser_var.set(browser_list[0])
+        if browsers:
+            self.load_browser_profiles(browser_list[0])
+
     def load_browser_profiles(self, browser_name):
         """Load profiles for selected browser"""
         if browser_name in self.browsers:
-            browser_path = self.browsers[browser_name]
-            profiles = BrowserDetector.get_profiles(browser_name, browser_path)
-            self.browser_profiles[browser_name] = profiles
+            profiles = self.browser_profiles.get(browser_name)
+            if profiles is None:
+                profiles = BrowserDetector.get_profiles(browser_name, self.browsers[browser_name])
+                self.browser_profiles[browser_name] = profiles
 
             # Update profile menu
             if profiles:
@@ -889,25 +1134,54 @@ class YouTubeDownloaderGUI:
                 self.profile_menu.configure(values=["Default"])
                 self.profile_var.set("Default")
 
-    def on_url_change(self, event=None):
-        """Detect URL change and trigger auto-analysis"""
+    def get_urls_from_textbox(self, dedupe=False):
+        """Get valid URLs from the URL textbox, optionally collapsing duplicates of the same video"""
         current_text = self.url_entry.get("1.0", "end").strip()
 
-        # Get all valid URLs
+        # Split by newlines and filter out empty lines and placeholder
         urls = [line.strip() for line in current_text.split('\n')
                 if line.strip() and line.strip().startswith("http")
                 and "youtube.com/watch?v=..." not in line]
 
+        if dedupe:
+            unique_urls = dedupe_urls(urls)
+            if len(unique_urls) < len(urls):
+                self.log_message(f"Removed {len(urls) - len(unique_urls)} duplicate URL(s)")
+                self.url_entry.delete("1.0", "end")
+                self.url_entry.insert("1.0", "\n".join(unique_urls))
+            urls = unique_urls
+
+        return urls
+
+    def on_url_change(self, event=None):
+        """Detect URL change and trigger auto-analysis"""
+        # Get all valid URLs
+        urls = self.get_urls_from_textbox()
+
         # Update UI based on URL count
         self.update_ui_for_url_count(len(urls))
 
-        # Get first valid URL for auto-analysis
-        current_url = urls[0] if urls else ""
+        # Re-analyze only when the set of URLs changed, not on every keystroke
+        # (until the URL patterns are loaded duplicates are left to the analysis, which shares them per video)
+        url_set = tuple(dedupe_urls(urls) if self.url_matching_ready.is_set() else dict.fromkeys(urls))
+        if url_set == self.last_url_set:
+            return
+        self.last_url_set = url_set
+
+        # Debounce: restart the timer on every edit so only the latest URL set is analyzed
+        if self._auto_analyze_after_id is not None:
+            self.window.after_cancel(self._auto_analyze_after_id)
+            self._auto_analyze_after_id = None
+            self._coalesced_edits += 1
+
+        if not url_set:
+            # Nothing left to analyze - stop whatever is still running for the old URLs
+            self.cancel_analysis()
+            return
 
-        if current_url and current_url != self.last_url:
-            self.last_url = current_url
-            # Delay analysis slightly to allow full URL to be pasted
-            self.window.after(500, lambda: self.auto_analyze_video(current_url))
+        self._auto_analyze_after_id = self.window.after(
+            self.auto_analyze_delay, lambda: self.auto_analyze_video(url_set)
+        )
 
     def on_url_paste(self, event=None):
         """Detect paste event"""
@@ -949,13 +1223,16 @@ class YouTubeDownloaderGUI:
             # Update options visibility based on checkboxes
             self.toggle_options()
 
-    def auto_analyze_video(self, url):
-        """Automatically analyze video when URL is pasted"""
-        if not self.auto_analyzing:
-            # Check if URL still exists in textbox
-            current_text = self.url_entry.get("1.0", "end").strip()
-            if url in current_text:
-                self.analyze_video()
+    def auto_analyze_video(self, url_set):
+        """Automatically analyze the URLs once editing has settled"""
+        self._auto_analyze_after_id = None
+        if self._coalesced_edits:
+            self.log_message(f"Auto-analysis: coalesced {self._coalesced_edits} intermediate edit(s)")
+            self._coalesced_edits = 0
+
+        # Check the URLs are still the ones in the textbox
+        if url_set == self.last_url_set:
+            self.analyze_video(list(url_set))
 
     def on_container_change(self, choice):
         """Handle custom container format"""
@@ -1020,192 +1297,185 @@ class YouTubeDownloaderGUI:
         else:
             self.subtitle_options_frame.pack_forget()
 
-    def download_and_cache_thumbnail(self, thumbnail_url, url_hash):
-        """Download thumbnail and cache it as temporary file"""
+    def get_cached_thumbnail(self, video_key):
+        """Return (local_path, ctk_image) from the in-memory thumbnail LRU, or None"""
+        with self.thumbnail_lock:
+            cached = self.thumbnail_cache.get(video_key)
+            if cached is None:
+                return None
+            if not os.path.exists(cached[0]):
+                # The file was evicted from the thumbnail store - drop the image with it
+                del self.thumbnail_cache[video_key]
+                return None
+            self.thumbnail_cache.move_to_end(video_key)
+            return cached
+
+    def download_and_cache_thumbnail(self, thumbnail_url, video_key):
+        """Download thumbnail into the thumbnail store (unless stored already) and keep its image in memory"""
         if not thumbnail_url:
             return None
 
         # Check if already cached
-        if thumbnail_url in self.thumbnail_cache:
-            cached_path, cached_image = self.thumbnail_cache[thumbnail_url]
-            if os.path.exists(cached_path):
-                return cached_path, cached_image
+        cached = self.get_cached_thumbnail(video_key)
+        if cached:
+            return cached
 
         try:
-            # Download thumbnail to temp file
-            file_ext = os.path.splitext(thumbnail_url.split('?')[0])[1] or '.jpg'
-            temp_path = self.thumbnail_cache_dir / f"thumb_{url_hash}{file_ext}"
-
-            urlretrieve(thumbnail_url, str(temp_path))
+            # Stored files survive restarts, so only new videos are downloaded
+            path = str(self.thumbnail_store.fetch(video_key, thumbnail_url))
 
             # Create CTkImage if PIL is available
             ctk_image = None
             if HAS_PIL:
                 try:
-                    img = Image.open(temp_path)
-                    img.thumbnail((120, 68), Image.Resampling.LANCZOS)
+                    with Image.open(path) as img:
+                        img.thumbnail((120, 68), Image.Resampling.LANCZOS)
+                        img.load()
                     ctk_image = ctk.CTkImage(light_image=img, dark_image=img, size=(120, 68))
                 except Exception as e:
                     self.log_message(f"Failed to create thumbnail image: {str(e)}")
 
-            # Cache the result
-            self.thumbnail_cache[thumbnail_url] = (str(temp_path), ctk_image)
-            return str(temp_path), ctk_image
+            # Cache the result, dropping the least recently used images beyond thumbnail_memory_size
+            with self.thumbnail_lock:
+                self.thumbnail_cache[video_key] = (path, ctk_image)
+                self.thumbnail_cache.move_to_end(video_key)
+                while len(self.thumbnail_cache) > self.thumbnail_memory_size:
+                    self.thumbnail_cache.popitem(last=False)
+            return path, ctk_image
 
         except Exception as e:
             self.log_message(f"Failed to download thumbnail: {str(e)}")
             return None
 
-    def analyze_video(self):
+    def update_cookie_browser(self, *args):
+        """Keep the cookie setting in a plain attribute that worker threads can read (Tk variable trace)"""
+        self.cookie_browser = self.get_cookie_browser()
+
+    def get_cookie_browser(self):
+        """Get the browser[:profile] value for --cookies-from-browser, or None if cookies are disabled (main thread)"""
+        if self.use_cookies_var.get():
+            browser = self.browser_var.get()
+            profile = self.profile_var.get()
+            if browser and browser not in (self.lang.get("no_browsers_found"), self.lang.get("detecting_browsers")):
+                return f"{browser}:{profile}" if profile and profile != "Default" else browser
+        return None
+
+    def cancel_analysis(self):
+        """Cancel the running analysis, killing its yt-dlp processes"""
+        token = self._analysis_token
+        self._analysis_token = None
+        if token is None or token.cancelled:
+            return
+        killed = token.cancel()
+        self.log_message(f"Cancelled outdated analysis ({killed} yt-dlp process(es) killed)")
+
+    def analyze_video(self, urls=None):
         """Analyze video URL to get available formats"""
         # Get all valid URLs from textbox
-        current_text = self.url_entry.get("1.0", "end").strip()
-        urls = []
-        for line in current_text.split('\n'):
-            line = line.strip()
-            if line and line.startswith("http") and "youtube.com/watch?v=..." not in line:
-                urls.append(line)
+        if urls is None:
+            urls = self.get_urls_from_textbox(dedupe=True)
 
         if not urls:
             return
 
-        # Check if yt-dlp is installed
-        if not self.check_ytdlp():
+        # Check if the extraction backend is available
+        if not self.check_extractor():
             messagebox.showerror(
                 self.lang.get("error_title"),
                 self.lang.get("error_ytdlp_not_found")
             )
             return
 
-        self.auto_analyzing = True
-        # Clear previous analysis results
-        self.analysis_status.configure(state="normal")
-        self.analysis_status.delete("1.0", "end")
-        self.analysis_status.insert("1.0", self.lang.get("analyzing") + "\n")
-        self.analysis_status.configure(state="disabled")
+        # Only the latest URL set is analyzed - stop the previous run instead of waiting for it
+        self.cancel_analysis()
+        token = CancelToken()
+        self._analysis_token = token
+
+        # Clear previous analysis results (queued so it lands after results the old run already posted)
+        self.ui_events.post("analysis_status", text=self.lang.get("analyzing") + "\n", reset=True)
 
         # Start analysis in separate thread for all URLs
-        thread = threading.Thread(target=self._analyze_video_thread, args=(urls,))
+        thread = threading.Thread(target=self._analyze_video_thread, args=(urls, token))
         thread.daemon = True
         thread.start()
 
-    def _analyze_video_thread(self, urls):
+    def _analyze_video_thread(self, urls, token=None):
         """Thread function to analyze video formats for multiple URLs"""
         # Convert single URL to list for backward compatibility
         if isinstance(urls, str):
             urls = [urls]
+        if token is None:
+            token = CancelToken()
+        completed = [0]
+
+        def on_result(idx, url, entry, error):
+            """Show each analysis result as soon as it is delivered"""
+            # A newer analysis owns the status box now - drop stale results
+            if token.cancelled:
+                return
+            completed[0] += 1
+            if error is not None:
+                error_msg = f"✗ Video {idx + 1}: {self.lang.get('analysis_failed')}\n"
+                self.ui_events.post("analysis_status", text=error_msg)
+                self.log_message(f"Analysis error ({url}): {str(error)}")
+                return
 
-        try:
-            for idx, url in enumerate(urls, 1):
-                self.log_message(f"Analyzing {idx}/{len(urls)}: {url}")
-
-                # Get video information with JSON output
-                cmd = self.get_ytdlp_command() + ["-J", "--no-playlist", url]
-
-                # Add cookie options if enabled
-                if self.use_cookies_var.get():
-                    browser = self.browser_var.get()
-                    profile = self.profile_var.get()
-                    if browser and browser != self.lang.get("no_browsers_found"):
-                        browser_profile = f"{browser}:{profile}" if profile and profile != "Default" else browser
-                        cmd.extend(["--cookies-from-browser", browser_profile])
-
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
+            # Quality options follow the last analyzed video - coalesced to one menu update per frame
+            self.ui_events.post("quality_options", key="main", max_height=entry["max_height"],
+                                max_audio_bitrate=entry["max_audio_bitrate"])
+
+            # Add result to analysis status textbox
+            result_msg = f"✓ Video {idx + 1}: {entry['title'][:40]}... | {entry['max_height']}p, {entry['max_audio_bitrate']} kbps\n"
+            self.ui_events.post("analysis_status", text=result_msg, color="green")
+            self.log_message(f"Analysis complete - Max video: {entry['max_height']}p, Max audio: {entry['max_audio_bitrate']} kbps")
 
-                if result.returncode != 0:
-                    error_msg = f"✗ Video {idx}: {self.lang.get('analysis_failed')}\n"
-                    self.analysis_status.configure(state="normal")
-                    self.analysis_status.insert("end", error_msg)
-                    self.analysis_status.configure(state="disabled")
-                    self.log_message(f"Analysis error: {result.stderr}")
+        try:
+            # Playlists and channels are only listed here - their videos are analyzed page by page in the batch window
+            video_urls = []
+            for url in urls:
+                try:
+                    expanded = self.engine.expand_url(url, cancel_token=token)
+                except AnalysisCancelled:
+                    return
+                except AnalysisError as e:
+                    self.log_message(f"✗ Failed to expand playlist {url}: {str(e)}")
+                    expanded = None
+                if expanded is None:
+                    video_urls.append(url)
                     continue
+                result_msg = f"✓ Playlist: {expanded['title'][:40]} | {len(expanded['entries'])} videos\n"
+                self.ui_events.post("analysis_status", text=result_msg, color="green")
 
-                # Parse JSON output
-                data = json.loads(result.stdout)
-                formats = data.get("formats", [])
-
-                # Find max video height and audio bitrate
-                max_height = 0
-                max_audio_br = 0
-
-                for fmt in formats:
-                    # Check video height
-                    if fmt.get("height"):
-                        max_height = max(max_height, fmt["height"])
-
-                    # Check audio bitrate
-                    if fmt.get("abr"):
-                        max_audio_br = max(max_audio_br, fmt["abr"])
-                    elif fmt.get("tbr") and not fmt.get("height"):  # Audio-only format
-                        max_audio_br = max(max_audio_br, fmt["tbr"])
-
-                # Store max values from last analyzed video for quality options
-                self.max_height = max_height
-                self.max_audio_bitrate = int(max_audio_br)
-
-                # Update UI
-                self.update_quality_options()
-
-                video_title = data.get("title", "Unknown")
-                duration = data.get("duration", 0)
-                duration_str = f"{int(duration//60)}:{int(duration%60):02d}" if duration else "Unknown"
-
-                # Download and cache thumbnail
-                thumbnail_url = data.get("thumbnail", "")
-                if thumbnail_url:
-                    url_hash = abs(hash(url)) % (10 ** 8)
-                    self.download_and_cache_thumbnail(thumbnail_url, url_hash)
-
-                # Get available subtitles
-                subtitles = data.get("subtitles", {})
-                automatic_captions = data.get("automatic_captions", {})
-                available_subtitle_langs = list(set(list(subtitles.keys()) + list(automatic_captions.keys())))
-                if not available_subtitle_langs:
-                    available_subtitle_langs = ["en"]
-
-                # Cache the analysis result for reuse in batch download
-                self.video_analysis_cache[url] = {
-                    "url": url,
-                    "title": video_title,
-                    "duration": duration_str,
-                    "thumbnail_url": thumbnail_url,
-                    "max_height": max_height,
-                    "max_audio_bitrate": int(max_audio_br),
-                    "available_subtitle_langs": available_subtitle_langs
-                }
-
-                # Add result to analysis status textbox
-                result_msg = f"✓ Video {idx}: {video_title[:40]}... | {max_height}p, {int(max_audio_br)} kbps\n"
-                self.analysis_status.configure(state="normal", text_color=("green", "green"))
-                self.analysis_status.insert("end", result_msg)
-                self.analysis_status.configure(state="disabled")
-                self.log_message(f"Analysis complete - Max video: {max_height}p, Max audio: {int(max_audio_br)} kbps")
-
-        except subprocess.TimeoutExpired:
-            error_msg = f"✗ {self.lang.get('analysis_timeout')}\n"
-            self.analysis_status.configure(state="normal")
-            self.analysis_status.insert("end", error_msg)
-            self.analysis_status.configure(state="disabled")
-            self.log_message("Analysis timeout - URL may be invalid or network is slow")
-        except json.JSONDecodeError:
-            error_msg = f"✗ {self.lang.get('analysis_failed')}\n"
-            self.analysis_status.configure(state="normal")
-            self.analysis_status.insert("end", error_msg)
-            self.analysis_status.configure(state="disabled")
-            self.log_message("Failed to parse video information")
+            self.log_message(f"Analyzing {len(video_urls)} URL(s) with {min(self.engine.analysis_workers, max(1, len(video_urls)))} worker(s) [{self.engine.extractor.name}]...")
+            self.engine.run_analysis(video_urls, on_result, token)
+            if not token.cancelled:
+                self.log_message(self.engine.video_analysis_cache.stats_text())
         except Exception as e:
+            if token.cancelled:
+                return
             error_msg = f"✗ {self.lang.get('analysis_error')}: {str(e)}\n"
-            self.analysis_status.configure(state="normal")
-            self.analysis_status.insert("end", error_msg)
-            self.analysis_status.configure(state="disabled")
+            self.ui_events.post("analysis_status", text=error_msg)
             self.log_message(f"Analysis error: {str(e)}")
         finally:
-            self.auto_analyzing = False
+            if token.cancelled:
+                self.log_message(f"Outdated analysis stopped: {completed[0]} URL(s) finished, "
+                                 f"{token.skipped} skipped")
+
+    def apply_analysis_status(self, text, color=None, reset=False):
+        """Append text to the analysis status box, or replace its content if reset"""
+        self.analysis_status.configure(state="normal")
+        if reset:
+            self.analysis_status.delete("1.0", "end")
+        if color:
+            self.analysis_status.configure(text_color=(color, color))
+        self.analysis_status.insert("end", text)
+        self.analysis_status.configure(state="disabled")
+
+    def apply_quality_options(self, max_height, max_audio_bitrate):
+        """Show the quality options of the last analyzed video"""
+        self.max_height = max_height
+        self.max_audio_bitrate = max_audio_bitrate
+        self.update_quality_options()
 
     def update_quality_options(self):
         """Update quality options based on analysis results - remove or disable unavailable"""
@@ -1233,8 +1503,6 @@ class YouTubeDownloaderGUI:
             if key == "best" or height <= self.max_height:
                 updated_options.append(label)
 
-        self.quality_menu.configure(values=updated_options)
-
         # Audio quality mapping
         audio_map = [
             (self.lang.get("bitrate_best"), 999999, "best"),
@@ -1252,6 +1520,11 @@ class YouTubeDownloaderGUI:
             if key == "best" or bitrate <= self.max_audio_bitrate:
                 updated_audio.append(label)
 
+        # Reconfiguring the menus redraws them - skip it when the options did not change
+        if self._quality_values == (updated_options, updated_audio):
+            return
+        self._quality_values = (updated_options, updated_audio)
+        self.quality_menu.configure(values=updated_options)
         self.audio_quality_menu.configure(values=updated_audio)
         self.video_audio_menu.configure(values=updated_audio)
 
@@ -1408,23 +1681,227 @@ class YouTubeDownloaderGUI:
         )
         cancel_button.pack(side="left", padx=5)
 
-    def log_message(self, message):
-        self.log_text.insert("end", message + "\n")
-        self.log_text.see("end")
-        self.window.update_idletasks()
+    def open_metrics_dashboard(self):
+        """Open a window with download throughput over time, the slowest downloads and per-format averages"""
+        dashboard = ctk.CTkToplevel(self.window)
+        dashboard.title(self.lang.get("metrics_title"))
+        dashboard.geometry("860x680")
+
+        # Time range -> (span, bar width) in seconds
+        ranges = {"24h": (24 * 3600, 3600), "7d": (7 * 86400, 6 * 3600), "30d": (30 * 86400, 86400)}
+        range_var = ctk.StringVar(value="24h")
+
+        controls = ctk.CTkFrame(dashboard)
+        controls.pack(padx=10, pady=(10, 5), fill="x")
+        summary_label = ctk.CTkLabel(controls, text="", anchor="w")
+        summary_label.pack(side="left", padx=10)
+
+        dark = ctk.get_appearance_mode() == "Dark"
+        background, foreground = ("#2b2b2b", "#dce4ee") if dark else ("#ebebeb", "#1a1a1a")
+        ctk.CTkLabel(dashboard, text=self.lang.get("metrics_throughput"), font=ctk.CTkFont(weight="bold"),
+                     anchor="w").pack(padx=10, fill="x")
+        canvas = Canvas(dashboard, height=180, bg=background, highlightthickness=0)
+        canvas.pack(padx=10, pady=5, fill="x")
+
+        mono = ctk.CTkFont(family="Courier", size=11)
+        ctk.CTkLabel(dashboard, text=self.lang.get("metrics_slowest"), font=ctk.CTkFont(weight="bold"),
+                     anchor="w").pack(padx=10, fill="x")
+        slowest_text = ctk.CTkTextbox(dashboard, height=150, font=mono, wrap="none")
+        slowest_text.pack(padx=10, pady=5, fill="both", expand=True)
+        ctk.CTkLabel(dashboard, text=self.lang.get("metrics_formats"), font=ctk.CTkFont(weight="bold"),
+                     anchor="w").pack(padx=10, fill="x")
+        formats_text = ctk.CTkTextbox(dashboard, height=150, font=mono, wrap="none")
+        formats_text.pack(padx=10, pady=(5, 10), fill="both", expand=True)
+
+        def size(value):
+            return f"{format_rate(value)}B" if value else "-"
+
+        def speed(value):
+            return f"{format_rate(value)}B/s" if value else "-"
+
+        def phases(row):
+            return "/".join(f"{value or 0:.1f}" for value in row)
+
+        def set_text(textbox, lines):
+            textbox.configure(state="normal")
+            textbox.delete("1.0", "end")
+            textbox.insert("1.0", "\n".join(lines) if len(lines) > 1 else self.lang.get("metrics_empty"))
+            textbox.configure(state="disabled")
+
+        def draw_chart(event=None):
+            span, bucket = ranges[range_var.get()]
+            first = int((time.time() - span) // bucket) * bucket
+            rows = {slot: (total, seconds) for slot, total, seconds in self.engine.metrics.throughput(first, bucket)}
+            slots = [first + i * bucket for i in range(span // bucket + 1)]
+            values = [rows[slot][0] / rows[slot][1] if slot in rows and rows[slot][1] else 0 for slot in slots]
+
+            canvas.delete("all")
+            width, height = max(canvas.winfo_width(), 200), 180
+            left, bottom = 70, height - 20
+            peak = max(values)
+            if not peak:
+                canvas.create_text(width // 2, height // 2, text=self.lang.get("metrics_empty"), fill=foreground)
+                return
+            bar = (width - left - 10) / len(slots)
+            for i, value in enumerate(values):
+                if value:
+                    x = left + i * bar
+                    canvas.create_rectangle(x + 1, bottom - (bottom - 10) * value / peak, x + bar - 1, bottom,
+                                            fill="#1f6aa5", outline="")
+            canvas.create_line(left, bottom, width - 10, bottom, fill=foreground)
+            canvas.create_text(left - 5, 10, text=speed(peak), anchor="e", fill=foreground)
+            canvas.create_text(left - 5, bottom, text="0", anchor="e", fill=foreground)
+            label_format = "%H:%M" if bucket < 86400 else "%m-%d"
+            canvas.create_text(left, bottom + 10, anchor="w", fill=foreground,
+                               text=time.strftime(label_format, time.localtime(slots[0])))
+            canvas.create_text(width - 10, bottom + 10, anchor="e", fill=foreground,
+                               text=time.strftime(label_format, time.localtime(slots[-1])))
+
+        def refresh(choice=None):
+            span, _ = ranges[range_var.get()]
+            rows = self.engine.metrics.throughput(time.time() - span, span)
+            total = sum(row[1] or 0 for row in rows)
+            seconds = sum(row[2] or 0 for row in rows)
+            summary_label.configure(text=f"{size(total)} in {seconds:.0f}s downloading, "
+                                         f"{speed(total / seconds if seconds else 0)} average")
+            draw_chart()
+
+            header = f"{'title':<36} {'site':<10} {'size':>8} {'speed':>10} {'total s':>8}  extract/download/merge/post s"
+            set_text(slowest_text, [header] + [
+                f"{title[:36]:<36} {host[:10]:<10} {size(total):>8} {speed(mean):>10} {elapsed:8.1f}  {phases(row)}"
+                for title, host, total, mean, elapsed, *row in self.engine.metrics.slowest(20)
+            ])
+            header = f"{'format':<40} {'runs':>5} {'failed':>6} {'speed':>10} {'total s':>8}  extract/download/merge/post s"
+            set_text(formats_text, [header] + [
+                f"{profile[:40]:<40} {runs:>5} {failed:>6} {speed(mean):>10} {elapsed:8.1f}  {phases(row)}"
+                for profile, runs, failed, mean, elapsed, *row in self.engine.metrics.by_profile()
+            ])
+
+        range_menu = ctk.CTkSegmentedButton(controls, values=list(ranges), variable=range_var, command=refresh)
+        range_menu.pack(side="right", padx=5)
+        ctk.CTkButton(controls, text=self.lang.get("refresh"), width=80, command=refresh).pack(side="right", padx=5)
+        canvas.bind("<Configure>", draw_chart)
+        refresh()
 
-    def check_ytdlp(self):
-        """Check if yt-dlp is available"""
+    def log_message(self, message):
+        """Queue a log line - safe to call from any thread, shown by the next flush_log"""
+        self.log_pipeline.put(message)
+
+    def flush_log(self):
+        """Move queued log lines into the log textbox in one insert, keeping at most log_max_lines lines"""
+        messages = self.log_pipeline.drain()
+        if messages:
+            # Lines that would be trimmed right away are only written to the log file
+            self.log_text.insert("end", "\n".join(messages[-self.log_max_lines:]) + "\n")
+            excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - self.log_max_lines
+            if excess > 0:
+                self.log_text.delete("1.0", f"{excess + 1}.0")
+            self.log_text.see("end")
+        self.window.after(self.log_flush_interval, self.flush_log)
+
+    def add_job_row(self, job_id, title):
+        """Add a progress row for a queued download job (main thread)"""
+        # Rows of a finished batch make way for the next one
+        states = dict(self.job_states)
+        if states and all(state in DownloadEngine.FINISHED_STATES for state in states.values()):
+            for finished_id in states:
+                self.job_progress.pop(finished_id, None)
+                self.job_states.pop(finished_id, None)
+                self.job_details.pop(finished_id, None)
+            self.clear_job_rows(list(states))
+
+        self.job_progress[job_id] = 0.0
+        self.job_states[job_id] = "queued"
+        self.build_job_row(job_id, title)
+
+    def build_job_row(self, job_id, title):
+        """Create the progress row of a queued job"""
+        if not self.jobs_frame.winfo_manager():
+            self.jobs_frame.pack(padx=10, pady=(0, 5), fill="x", before=self.progress_bar)
+        row_frame = ctk.CTkFrame(self.jobs_frame)
+        row_frame.pack(fill="x", pady=1)
+        title_label = ctk.CTkLabel(row_frame, text=title[:40] + "..." if len(title) > 40 else title, width=280, anchor="w")
+        title_label.grid(row=0, column=0, padx=5, sticky="w")
+        progress_bar = ctk.CTkProgressBar(row_frame, width=200)
+        progress_bar.grid(row=0, column=1, padx=5)
+        progress_bar.set(self.job_progress.get(job_id, 0))
+        status_label = ctk.CTkLabel(row_frame, text=self.lang.get("queued"), width=140, anchor="w")
+        status_label.grid(row=0, column=2, padx=5, sticky="w")
+        self.job_rows[job_id] = (row_frame, progress_bar, status_label)
+        self.update_overall_progress()
+
+    def update_job_row(self, job_id, fraction=None, status=None, state=None):
+        """Update a job's row and the overall progress (main thread)"""
+        if fraction is not None:
+            self.job_progress[job_id] = fraction
+        if state is not None:
+            self.job_states[job_id] = state
+        self.apply_job_progress(job_id, fraction, status)
+        # The overall bar is redrawn once per frame, not once per job
+        self.ui_events.post("overall_progress", key="main")
+
+    def apply_job_progress(self, job_id, fraction=None, status=None):
+        """Draw a job's progress and status"""
+        if job_id in self.job_rows:
+            _, progress_bar, status_label = self.job_rows[job_id]
+            if fraction is not None:
+                progress_bar.set(fraction)
+            if status is not None:
+                status_label.configure(text=status)
+
+    def apply_progress(self, fraction=None, text=None):
+        """Draw the main progress bar and label"""
+        if fraction is not None:
+            self.progress_bar.set(fraction)
+        if text is not None:
+            self.progress_label.configure(text=text)
+
+    def clear_job_rows(self, job_ids):
+        """Remove the rows of finished jobs"""
+        for job_id in job_ids:
+            widgets = self.job_rows.pop(job_id, None)
+            if widgets:
+                widgets[0].destroy()
+        if not self.job_rows:
+            self.jobs_frame.pack_forget()
+
+    def update_overall_progress(self):
+        """Show the average progress and job counts of all jobs on the main progress bar"""
+        progress = list(self.job_progress.values())
+        states = list(self.job_states.values())
+        if not progress:
+            return
+        self.progress_bar.set(sum(progress) / len(progress))
+        self.progress_label.configure(text=self.lang.get(
+            "jobs_progress",
+            done=sum(state in DownloadEngine.FINISHED_STATES for state in states),
+            total=len(states),
+            running=states.count("running")
+        ))
+
+    def start_control_api(self):
+        """Start the control API (see ControlServer); downloads it queues use the current download folder"""
+        port = int(self.config.get("control_api_port", 8765))
         try:
-            result = subprocess.run(
-                self.get_ytdlp_command() + ["--version"],
-                capture_output=True,
-                text=True,
-                timeout=5
+            self.control_server = ControlServer(
+                self.engine, port, self.config.get("control_api_token", ""),
+                defaults=lambda: {"output": self.download_path}
             )
-            return result.returncode == 0
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            return False
+        except OSError as e:
+            self.log_message(f"Could not start the control API on port {port}: {str(e)}")
+            return
+        self.control_server.start()
+        self.log_message(f"Control API listening on http://127.0.0.1:{self.control_server.port}/api/")
+
+    def check_ytdlp(self):
+        """Check if yt-dlp is available (probed once, then answered from the tool registry)"""
+        return self.engine.tools.available("yt-dlp")
+
+    def check_extractor(self):
+        """Check if the analysis backend is available (no process is spawned for the in-process backend)"""
+        if self.engine.extractor.name == "subprocess":
+            return self.check_ytdlp()
+        return self.engine.extractor.version() is not None
 
     def start_download(self):
         # Get URLs from textbox
@@ -1434,10 +1911,8 @@ class YouTubeDownloaderGUI:
             messagebox.showerror(self.lang.get("error_title"), self.lang.get("error_no_url"))
             return
 
-        # Split by newlines and filter out empty lines and placeholder
-        urls = [line.strip() for line in urls_text.split('\n')
-                if line.strip() and line.strip().startswith("http")
-                and "youtube.com/watch?v=..." not in line]
+        # Split by newlines, filter out empty lines and placeholder, collapse duplicate videos
+        urls = self.get_urls_from_textbox(dedupe=True)
 
         if not urls:
             messagebox.showerror(self.lang.get("error_title"), self.lang.get("error_no_url"))
@@ -1451,15 +1926,12 @@ class YouTubeDownloaderGUI:
             )
             return
 
-        # If multiple URLs, open batch configuration window
-        if len(urls) > 1:
+        # If multiple URLs (or a playlist/channel), open batch configuration window
+        if len(urls) > 1 or is_collection_url(urls[0]):
             self.open_batch_config_window(urls)
         else:
-            # Single URL - use current settings
-            self.download_button.configure(state="disabled")
-            thread = threading.Thread(target=self.download_single_with_types, args=(urls[0],))
-            thread.daemon = True
-            thread.start()
+            # Single URL - queue with current settings
+            self.download_single_with_types(urls[0])
 
     def open_video_settings_dialog(self, video_info):
         """Open dialog to configure individual video settings"""
@@ -1489,6 +1961,9 @@ class YouTubeDownloaderGUI:
         audio_quality_var = None
         subtitle_format_var = None
         subtitle_language_var = None
+        fragments_var = None
+        chunk_size_var = None
+        downloader_var = None
 
         # Show video options only if video download is checked
         if show_video:
@@ -1576,6 +2051,24 @@ class YouTubeDownloaderGUI:
             subtitle_language_menu = ctk.CTkComboBox(scroll_frame, values=available_langs, variable=subtitle_language_var)
             subtitle_language_menu.pack(pady=5, padx=20, fill="x")
 
+        # Download engine options apply to video and audio downloads
+        if show_video or show_audio:
+            ctk.CTkLabel(scroll_frame, text="Concurrent Fragments:", font=ctk.CTkFont(size=12, weight="bold")).pack(pady=(10, 5), padx=20, anchor="w")
+            fragments_var = ctk.StringVar(value=str(video_info.get("concurrent_fragments", self.engine.concurrent_fragments)))
+            fragments_menu = ctk.CTkComboBox(scroll_frame, values=["1", "2", "4", "8", "16"], variable=fragments_var)
+            fragments_menu.pack(pady=5, padx=20, fill="x")
+
+            ctk.CTkLabel(scroll_frame, text="HTTP Chunk Size (e.g. 10M, empty = off):", font=ctk.CTkFont(size=12, weight="bold")).pack(pady=(10, 5), padx=20, anchor="w")
+            chunk_size_var = ctk.StringVar(value=video_info.get("http_chunk_size", self.engine.http_chunk_size))
+            chunk_size_entry = ctk.CTkEntry(scroll_frame, textvariable=chunk_size_var)
+            chunk_size_entry.pack(pady=5, padx=20, fill="x")
+
+            ctk.CTkLabel(scroll_frame, text="Downloader:", font=ctk.CTkFont(size=12, weight="bold")).pack(pady=(10, 5), padx=20, anchor="w")
+            downloader_var = ctk.StringVar(value=video_info.get("external_downloader", self.engine.external_downloader))
+            downloaders = [d for d in EXTERNAL_DOWNLOADERS if d == "native" or self.engine.tools.available(d)]
+            downloader_menu = ctk.CTkComboBox(scroll_frame, values=downloaders, variable=downloader_var)
+            downloader_menu.pack(pady=5, padx=20, fill="x")
+
         # Save button
         def save_settings():
             if quality_var:
@@ -1592,6 +2085,17 @@ class YouTubeDownloaderGUI:
                 video_info["subtitle_format"] = subtitle_format_var.get()
             if subtitle_language_var:
                 video_info["subtitle_language"] = subtitle_language_var.get()
+            if fragments_var:
+                try:
+                    video_info["concurrent_fragments"] = max(1, int(fragments_var.get()))
+                except ValueError:
+                    pass
+            if chunk_size_var:
+                chunk_size = chunk_size_var.get().strip()
+                if not chunk_size or re.fullmatch(r"\d+(\.\d+)?[KkMmGg]?", chunk_size):
+                    video_info["http_chunk_size"] = chunk_size
+            if downloader_var:
+                video_info["external_downloader"] = downloader_var.get().strip() or "native"
             dialog.destroy()
 
         button_frame = ctk.CTkFrame(dialog)
@@ -1612,9 +2116,15 @@ class YouTubeDownloaderGUI:
         # Disable download button while config window is open
         self.download_button.configure(state="disabled")
 
+        # Page analysis still running when the window is closed is no longer needed
+        analysis_token = CancelToken()
+
         # Re-enable download button when config window is closed
         def on_config_window_close():
             self.download_button.configure(state="normal")
+            killed = analysis_token.cancel()
+            if killed:
+                self.log_message(f"Batch window closed - stopped {killed} running yt-dlp process(es)")
             config_window.destroy()
 
         config_window.protocol("WM_DELETE_WINDOW", on_config_window_close)
@@ -1623,162 +2133,63 @@ class YouTubeDownloaderGUI:
         loading_label = ctk.CTkLabel(config_window, text="Analyzing videos...\nPlease wait...", font=ctk.CTkFont(size=16))
         loading_label.pack(expand=True)
 
-        # Analyze URLs in separate thread to prevent UI freeze
+        # Playlists are expanded first; full analysis runs page by page for the rows that are shown
         video_info_list = []
 
-        def analyze_videos_thread():
-            """Analyze all videos in background thread"""
-            self.log_message(f"Processing {len(urls)} videos...")
-
-            for idx, url in enumerate(urls, 1):
-                # Check if we have cached analysis for this URL
-                if url in self.video_analysis_cache:
-                    cached = self.video_analysis_cache[url]
-                    self.log_message(f"Using cached analysis for video {idx}/{len(urls)}: {cached['title'][:40]}...")
-
-                    video_info_list.append({
-                        "url": url,
-                        "title": cached["title"],
-                        "duration": cached["duration"],
-                        "thumbnail_url": cached["thumbnail_url"],
-                        "max_height": cached["max_height"],
-                        "max_audio_bitrate": cached["max_audio_bitrate"],
-                        "available_subtitle_langs": cached["available_subtitle_langs"],
-                        "download_video": ctk.BooleanVar(value=self.download_video_var.get()),
-                        "download_audio": ctk.BooleanVar(value=self.download_audio_var.get()),
-                        "download_thumbnail": ctk.BooleanVar(value=self.download_thumbnail_var.get()),
-                        "download_subtitle": ctk.BooleanVar(value=False),
-                        "subtitle_format": "srt",
-                        "subtitle_language": cached["available_subtitle_langs"][0] if cached["available_subtitle_langs"] else "en",
-                        "video_quality": self.video_quality_var.get(),
-                        "video_codec": self.video_codec_var.get(),
-                        "video_container": self.video_container_var.get(),
-                        "audio_format": self.audio_format_var.get(),
-                        "audio_quality": self.audio_quality_var.get()
-                    })
-                    continue
+        def make_video_info(item):
+            """Build a batch row from an expanded item - analysis results are filled in later"""
+            return {
+                "url": item["url"],
+                "title": item.get("title") or item["url"],
+                "duration": format_duration(item.get("duration")),
+                "thumbnail_url": "",
+                "max_height": 0,
+                "max_audio_bitrate": 0,
+                "available_subtitle_langs": ["en"],
+                "download_video": ctk.BooleanVar(value=self.download_video_var.get()),
+                "download_audio": ctk.BooleanVar(value=self.download_audio_var.get()),
+                "download_thumbnail": ctk.BooleanVar(value=self.download_thumbnail_var.get()),
+                "download_subtitle": ctk.BooleanVar(value=False),
+                "subtitle_format": "srt",
+                "subtitle_language": "en",
+                "video_quality": self.video_quality_var.get(),
+                "video_codec": self.video_codec_var.get(),
+                "video_container": self.video_container_var.get(),
+                "audio_format": self.audio_format_var.get(),
+                "audio_quality": self.audio_quality_var.get(),
+                "concurrent_fragments": self.engine.concurrent_fragments,
+                "http_chunk_size": self.engine.http_chunk_size,
+                "external_downloader": self.engine.external_downloader
+            }
 
-                # No cache - need to analyze
-                self.log_message(f"Analyzing video {idx}/{len(urls)}...")
-                try:
-                    cmd = self.get_ytdlp_command() + ["-J", "--no-playlist", url]
-                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        def apply_analysis(info, analysis, error):
+            """Copy an analysis result (or error) into a batch row"""
+            if error is not None:
+                info["title"] = f"Error: {str(error)}"
+                return
+            info["title"] = analysis["title"]
+            info["duration"] = analysis["duration"]
+            info["thumbnail_url"] = analysis["thumbnail_url"]
+            info["max_height"] = analysis["max_height"]
+            info["max_audio_bitrate"] = analysis["max_audio_bitrate"]
+            info["available_subtitle_langs"] = analysis["available_subtitle_langs"]
+            if analysis["available_subtitle_langs"]:
+                info["subtitle_language"] = analysis["available_subtitle_langs"][0]
+
+        def expand_thread():
+            """Expand playlists/channels into lightweight entries in background thread"""
+            self.log_message(f"Processing {len(urls)} URL(s)...")
+            items = self.engine.expand_urls(urls)
+            self.ui_events.post("call", callback=lambda: build_config_ui(items))
+
+        def build_config_ui(items):
+            """Build the configuration UI as soon as the URL list is known"""
+            if not config_window.winfo_exists():
+                return
+
+            for item in items:
+                video_info_list.append(make_video_info(item))
 
-                    if result.returncode == 0:
-                        data = json.loads(result.stdout)
-                        title = data.get("title", "Unknown")
-                        duration = data.get("duration", 0)
-                        duration_str = f"{int(duration//60)}:{int(duration%60):02d}" if duration else "Unknown"
-                        thumbnail_url = data.get("thumbnail", "")
-
-                        # Analyze available formats
-                        formats = data.get("formats", [])
-                        max_height = 0
-                        max_audio_br = 0
-
-                        for fmt in formats:
-                            if fmt.get("height"):
-                                max_height = max(max_height, fmt["height"])
-                            if fmt.get("abr"):
-                                max_audio_br = max(max_audio_br, fmt["abr"])
-                            elif fmt.get("tbr") and not fmt.get("height"):
-                                max_audio_br = max(max_audio_br, fmt["tbr"])
-
-                        # Get available subtitles
-                        subtitles = data.get("subtitles", {})
-                        automatic_captions = data.get("automatic_captions", {})
-                        available_subtitle_langs = list(set(list(subtitles.keys()) + list(automatic_captions.keys())))
-                        if not available_subtitle_langs:
-                            available_subtitle_langs = ["en"]  # Default to English if no subtitles found
-
-                        # Download and cache thumbnail
-                        if thumbnail_url:
-                            url_hash = abs(hash(url)) % (10 ** 8)
-                            self.download_and_cache_thumbnail(thumbnail_url, url_hash)
-
-                        # Cache the result
-                        self.video_analysis_cache[url] = {
-                            "url": url,
-                            "title": title,
-                            "duration": duration_str,
-                            "thumbnail_url": thumbnail_url,
-                            "max_height": max_height,
-                            "max_audio_bitrate": int(max_audio_br),
-                            "available_subtitle_langs": available_subtitle_langs
-                        }
-
-                        self.log_message(f"✓ {title[:50]} - {duration_str} | {max_height}p, {int(max_audio_br)} kbps")
-
-                        video_info_list.append({
-                            "url": url,
-                            "title": title,
-                            "duration": duration_str,
-                            "thumbnail_url": thumbnail_url,
-                            "max_height": max_height,
-                            "max_audio_bitrate": int(max_audio_br),
-                            "available_subtitle_langs": available_subtitle_langs,
-                            "download_video": ctk.BooleanVar(value=self.download_video_var.get()),
-                            "download_audio": ctk.BooleanVar(value=self.download_audio_var.get()),
-                            "download_thumbnail": ctk.BooleanVar(value=self.download_thumbnail_var.get()),
-                            "download_subtitle": ctk.BooleanVar(value=False),
-                            "subtitle_format": "srt",
-                            "subtitle_language": available_subtitle_langs[0] if available_subtitle_langs else "en",
-                            "video_quality": self.video_quality_var.get(),
-                            "video_codec": self.video_codec_var.get(),
-                            "video_container": self.video_container_var.get(),
-                            "audio_format": self.audio_format_var.get(),
-                            "audio_quality": self.audio_quality_var.get()
-                        })
-                    else:
-                        self.log_message(f"✗ Error analyzing URL")
-                        video_info_list.append({
-                            "url": url,
-                            "title": "Error analyzing",
-                            "duration": "Unknown",
-                            "thumbnail_url": "",
-                            "max_height": 0,
-                            "max_audio_bitrate": 0,
-                            "available_subtitle_langs": ["en"],
-                            "download_video": ctk.BooleanVar(value=True),
-                            "download_audio": ctk.BooleanVar(value=False),
-                            "download_thumbnail": ctk.BooleanVar(value=False),
-                            "download_subtitle": ctk.BooleanVar(value=False),
-                            "subtitle_format": "srt",
-                            "subtitle_language": "en",
-                            "video_quality": self.video_quality_var.get(),
-                            "video_codec": self.video_codec_var.get(),
-                            "video_container": self.video_container_var.get(),
-                            "audio_format": self.audio_format_var.get(),
-                            "audio_quality": self.audio_quality_var.get()
-                        })
-                except Exception as e:
-                    self.log_message(f"✗ Error: {str(e)}")
-                    video_info_list.append({
-                        "url": url,
-                        "title": f"Error: {str(e)}",
-                        "duration": "Unknown",
-                        "thumbnail_url": "",
-                        "max_height": 0,
-                        "max_audio_bitrate": 0,
-                        "available_subtitle_langs": ["en"],
-                        "download_video": ctk.BooleanVar(value=True),
-                        "download_audio": ctk.BooleanVar(value=False),
-                        "download_thumbnail": ctk.BooleanVar(value=False),
-                        "download_subtitle": ctk.BooleanVar(value=False),
-                        "subtitle_format": "srt",
-                        "subtitle_language": "en",
-                        "video_quality": self.video_quality_var.get(),
-                        "video_codec": self.video_codec_var.get(),
-                        "video_container": self.video_container_var.get(),
-                        "audio_format": self.audio_format_var.get(),
-                        "audio_quality": self.audio_quality_var.get()
-                    })
-
-            # Build UI after analysis completes (on main thread)
-            self.window.after(0, lambda: build_config_ui(config_window, loading_label, video_info_list, on_config_window_close))
-
-        def build_config_ui(config_window, loading_label, video_info_list, on_config_window_close):
-            """Build the configuration UI after analysis"""
             # Remove loading label
             loading_label.pack_forget()
 
@@ -1819,60 +2230,134 @@ class YouTubeDownloaderGUI:
             browse_btn.pack(side="left", padx=5)
 
             # Helper function to load thumbnail image
-            def load_thumbnail(thumbnail_url):
+            def load_thumbnail(url, thumbnail_url):
                 """Load thumbnail image and return CTkImage from cache"""
                 if not thumbnail_url:
                     return None
 
                 # Check cache first
-                if thumbnail_url in self.thumbnail_cache:
-                    cached_path, cached_image = self.thumbnail_cache[thumbnail_url]
-                    if cached_image:
-                        return cached_image
+                cached = self.get_cached_thumbnail(get_video_key(url))
+                if cached and cached[1]:
+                    return cached[1]
 
                 # If not cached or no image, return None (should have been downloaded during analysis)
                 return None
 
-            # Video rows
-            for info in video_info_list:
-                row_frame = ctk.CTkFrame(scroll_frame)
-                row_frame.pack(fill="x", padx=5, pady=2)
+            # Rows are rendered (and analyzed) one page at a time
+            rows_frame = ctk.CTkFrame(scroll_frame, fg_color="transparent")
+            rows_frame.pack(fill="x")
+            row_widgets = {}  # row index -> (thumbnail_label, title_label, duration_label)
+            rendered_count = [0]
+            analyzing_page = [False]
 
-                # Load and display thumbnail image directly
-                thumbnail_image = load_thumbnail(info["thumbnail_url"])
+            def update_row(idx):
+                """Refresh a row after its analysis result arrived"""
+                if idx not in row_widgets or not config_window.winfo_exists():
+                    return
+                info = video_info_list[idx]
+                thumbnail_label, title_label, duration_label = row_widgets[idx]
+
+                thumbnail_image = load_thumbnail(info["url"], info["thumbnail_url"])
                 if thumbnail_image:
-                    thumbnail_label = ctk.CTkLabel(row_frame, image=thumbnail_image, text="")
+                    thumbnail_label.configure(image=thumbnail_image, text="", fg_color="transparent")
                     thumbnail_label.image = thumbnail_image  # Keep reference
-                    thumbnail_label.grid(row=0, column=0, padx=5)
+                title_label.configure(text=info["title"][:35] + "..." if len(info["title"]) > 35 else info["title"])
+                duration_label.configure(text=info["duration"])
+
+            def analyze_page(start, end):
+                """Analyze the rows of one page in background thread"""
+                page_urls = [info["url"] for info in video_info_list[start:end]]
+
+                def on_result(pos, url, analysis, error):
+                    if analysis_token.cancelled:
+                        return
+                    idx = start + pos
+                    if error is None:
+                        self.log_message(f"✓ {idx + 1}/{len(video_info_list)} {analysis['title'][:50]} - {analysis['duration']} | {analysis['max_height']}p, {analysis['max_audio_bitrate']} kbps")
+                    else:
+                        self.log_message(f"✗ Error analyzing {url}: {str(error)}")
+                    apply_analysis(video_info_list[idx], analysis, error)
+                    self.ui_events.post("call", key=("batch_row", idx), callback=lambda: update_row(idx))
+
+                self.log_message(f"Analyzing videos {start + 1}-{end} of {len(video_info_list)} with {min(self.engine.analysis_workers, len(page_urls))} worker(s) [{self.engine.extractor.name}]...")
+                try:
+                    self.engine.run_analysis(page_urls, on_result, analysis_token)
+                except Exception as e:
+                    self.log_message(f"✗ Error: {str(e)}")
+                if analysis_token.cancelled:
+                    self.log_message(f"Batch analysis stopped: {analysis_token.skipped} URL(s) skipped")
                 else:
-                    # Placeholder if thumbnail not available
-                    placeholder_label = ctk.CTkLabel(row_frame, text="No\nPreview", width=120, height=68, fg_color="gray30")
-                    placeholder_label.grid(row=0, column=0, padx=5)
+                    self.log_message(self.engine.video_analysis_cache.stats_text())
+                analyzing_page[0] = False
+
+            def render_next_page():
+                """Render the next page of rows and start analyzing them"""
+                if analyzing_page[0] or rendered_count[0] >= len(video_info_list):
+                    return
+                start = rendered_count[0]
+                end = min(start + self.analysis_page_size, len(video_info_list))
 
-                title_label = ctk.CTkLabel(row_frame, text=info["title"][:35] + "..." if len(info["title"]) > 35 else info["title"], width=180, anchor="w")
-                title_label.grid(row=0, column=1, padx=5, sticky="w")
+                for idx in range(start, end):
+                    info = video_info_list[idx]
+                    row_frame = ctk.CTkFrame(rows_frame)
+                    row_frame.pack(fill="x", padx=5, pady=2)
 
-                duration_label = ctk.CTkLabel(row_frame, text=info["duration"], width=60)
-                duration_label.grid(row=0, column=2, padx=5)
+                    # Placeholder until the thumbnail is available
+                    thumbnail_label = ctk.CTkLabel(row_frame, text="No\nPreview", width=120, height=68, fg_color="gray30")
+                    thumbnail_label.grid(row=0, column=0, padx=5)
 
-                video_check = ctk.CTkCheckBox(row_frame, text="", variable=info["download_video"], width=50)
-                video_check.grid(row=0, column=3, padx=5)
+                    title_label = ctk.CTkLabel(row_frame, text=info["title"][:35] + "..." if len(info["title"]) > 35 else info["title"], width=180, anchor="w")
+                    title_label.grid(row=0, column=1, padx=5, sticky="w")
 
-                audio_check = ctk.CTkCheckBox(row_frame, text="", variable=info["download_audio"], width=50)
-                audio_check.grid(row=0, column=4, padx=5)
+                    duration_label = ctk.CTkLabel(row_frame, text=info["duration"], width=60)
+                    duration_label.grid(row=0, column=2, padx=5)
 
-                thumb_check = ctk.CTkCheckBox(row_frame, text="", variable=info["download_thumbnail"], width=50)
-                thumb_check.grid(row=0, column=5, padx=5)
+                    video_check = ctk.CTkCheckBox(row_frame, text="", variable=info["download_video"], width=50)
+                    video_check.grid(row=0, column=3, padx=5)
 
-                subtitle_check = ctk.CTkCheckBox(row_frame, text="", variable=info["download_subtitle"], width=50)
-                subtitle_check.grid(row=0, column=6, padx=5)
+                    audio_check = ctk.CTkCheckBox(row_frame, text="", variable=info["download_audio"], width=50)
+                    audio_check.grid(row=0, column=4, padx=5)
 
-                # Settings button for each video
-                def open_video_settings(video_info=info):
-                    self.open_video_settings_dialog(video_info)
+                    thumb_check = ctk.CTkCheckBox(row_frame, text="", variable=info["download_thumbnail"], width=50)
+                    thumb_check.grid(row=0, column=5, padx=5)
 
-                settings_btn = ctk.CTkButton(row_frame, text="⚙", width=60, command=open_video_settings)
-                settings_btn.grid(row=0, column=7, padx=5)
+                    subtitle_check = ctk.CTkCheckBox(row_frame, text="", variable=info["download_subtitle"], width=50)
+                    subtitle_check.grid(row=0, column=6, padx=5)
+
+                    # Settings button for each video
+                    def open_video_settings(video_info=info):
+                        self.open_video_settings_dialog(video_info)
+
+                    settings_btn = ctk.CTkButton(row_frame, text="⚙", width=60, command=open_video_settings)
+                    settings_btn.grid(row=0, column=7, padx=5)
+
+                    row_widgets[idx] = (thumbnail_label, title_label, duration_label)
+
+                rendered_count[0] = end
+                remaining = len(video_info_list) - end
+                if remaining > 0:
+                    load_more_button.configure(text=f"Load more ({remaining} remaining)")
+                else:
+                    load_more_button.pack_forget()
+
+                analyzing_page[0] = True
+                thread = threading.Thread(target=analyze_page, args=(start, end))
+                thread.daemon = True
+                thread.start()
+
+            load_more_button = ctk.CTkButton(scroll_frame, text="Load more", command=render_next_page)
+            load_more_button.pack(pady=5)
+
+            def check_scroll():
+                """Render the next page once the user scrolls to the bottom"""
+                if not config_window.winfo_exists() or rendered_count[0] >= len(video_info_list):
+                    return
+                if scroll_frame._parent_canvas.yview()[1] >= 0.98:
+                    render_next_page()
+                config_window.after(300, check_scroll)
+
+            render_next_page()
+            config_window.after(300, check_scroll)
 
             # Button frame
             button_frame = ctk.CTkFrame(config_window)
@@ -1881,11 +2366,9 @@ class YouTubeDownloaderGUI:
             def start_batch_download():
                 """Start downloading all configured videos"""
                 download_path = batch_download_path.get()
-                config_window.destroy()
-                self.download_button.configure(state="disabled")
-                thread = threading.Thread(target=self.download_batch_with_config, args=(video_info_list, download_path))
-                thread.daemon = True
-                thread.start()
+                on_config_window_close()
+                # Jobs go to the download queue - the main window stays free for the next batch
+                self.download_batch_with_config(video_info_list, download_path)
 
             start_button = ctk.CTkButton(button_frame, text=self.lang.get("download"), command=start_batch_download)
             start_button.pack(side="left", padx=5)
@@ -1893,125 +2376,170 @@ class YouTubeDownloaderGUI:
             cancel_button = ctk.CTkButton(button_frame, text=self.lang.get("cancel"), command=on_config_window_close)
             cancel_button.pack(side="left", padx=5)
 
-        # Start analysis thread
-        thread = threading.Thread(target=analyze_videos_thread)
+        # Start expansion thread
+        thread = threading.Thread(target=expand_thread)
         thread.daemon = True
         thread.start()
 
-    def download_batch_with_config(self, video_info_list, download_path=None):
-        """Download multiple videos with individual configurations"""
-        # Use custom download path if provided
-        original_path = self.download_path
-        if download_path:
-            self.download_path = download_path
-            self.log_message(f"Download location: {download_path}\n")
+    def schedule_download(self, url, title, types, settings, journal_id=None):
+        """Queue the selected types of url on the download engine and return a Future (see on_engine_job)"""
+        return self.engine.submit(url, title, types, settings, journal_id)
+
+    def on_engine_job(self, job):
+        """Queue a queued or changed engine job - from the GUI or the control API - for its progress row"""
+        self.ui_events.post("engine_job", key=job["id"], job=job)
+
+    def apply_engine_job(self, job):
+        """Mirror the latest state of an engine job in its progress row (main thread)"""
+        job_id = job["id"]
+        if job_id not in self.job_states:
+            self.add_job_row(job_id, job["title"])
+        if job["details"] is not None:
+            self.job_details[job_id] = job["details"]
+
+        state = job["state"]
+        if state == "running":
+            status = job["status"] or (f"{job['fraction'] * 100:.0f}%" if job["fraction"] else self.lang.get("downloading"))
+        else:
+            status = self.lang.get({
+                "queued": "queued",
+                "done": "download_completed",
+                "failed": "download_failed",
+                "cancelled": "cancelled"
+            }[state])
+        self.update_job_row(job_id, fraction=job["fraction"], status=status, state=state)
+
+    def notify_when_done(self, futures, message):
+        """Show a completion message once every future has finished"""
+        def wait():
+            for future in futures:
+                future.exception()
+            self.log_message("\n" + "="*50)
+            self.log_message("All downloads completed!")
+            self.log_message("="*50 + "\n")
+            self.ui_events.post("call", callback=lambda: messagebox.showinfo(
+                self.lang.get("success_title") if "success_title" in self.lang.translations else "완료",
+                message
+            ))
 
-        total = len(video_info_list)
-        for i, info in enumerate(video_info_list, 1):
-            self.log_message(f"\n{'='*50}")
-            self.log_message(f"Downloading {i}/{total}: {info['title']}")
-            self.log_message(f"{'='*50}\n")
-
-            # Download each selected type with individual settings
-            if info["download_video"].get():
-                self.log_message("Downloading video...")
-                self.download_video(
-                    info["url"],
-                    download_type="video",
-                    video_quality=info["video_quality"],
-                    video_codec=info["video_codec"],
-                    video_container=info["video_container"],
-                    audio_format=info["audio_format"],
-                    audio_quality=info["audio_quality"]
-                )
+        thread = threading.Thread(target=wait)
+        thread.daemon = True
+        thread.start()
 
-            if info["download_audio"].get():
-                self.log_message("Downloading audio...")
-                self.download_video(
-                    info["url"],
-                    download_type="audio",
-                    audio_format=info["audio_format"],
-                    audio_quality=info["audio_quality"]
-                )
+    def get_download_settings(self, video_quality, video_codec, video_container, audio_format, audio_quality,
+                              subtitle_format="srt", subtitle_language="en", download_path=None, **engine):
+        """Engine download settings (see DownloadEngine) from option menu texts - read widgets on the main thread"""
+        if video_container == self.lang.get("custom_format"):
+            video_container = self.custom_container_entry.get().strip() or "mp4"
+        if audio_format == self.lang.get("custom_format"):
+            audio_format = self.custom_audio_entry.get().strip() or "mp3"
+
+        return dict(
+            engine,
+            download_path=download_path or self.download_path,
+            video_height=self.get_height_from_quality(video_quality),
+            video_codec=self.get_codec_key(video_codec),
+            audio_bitrate=self.get_bitrate_from_text(audio_quality),
+            video_container=video_container,
+            audio_format=audio_format,
+            subtitle_format=subtitle_format,
+            subtitle_language=subtitle_language,
+            embed_thumbnail=self.embed_thumbnail_var.get(),
+            embed_metadata=self.embed_metadata_var.get(),
+            cookies_from_browser=self.get_cookie_browser()
+        )
 
-            if info["download_thumbnail"].get():
-                self.log_message("Downloading thumbnail...")
-                self.download_video(info["url"], download_type="thumbnail")
-
-            if info["download_subtitle"].get():
-                self.log_message(f"Downloading subtitle ({info['subtitle_format']}, {info['subtitle_language']})...")
-                self.download_video(
-                    info["url"],
-                    download_type="subtitle",
-                    subtitle_format=info["subtitle_format"],
-                    subtitle_language=info["subtitle_language"]
-                )
+    def download_batch_with_config(self, video_info_list, download_path=None):
+        """Queue multiple videos with individual configurations on the download engine"""
+        download_path = download_path or self.download_path
+        self.log_message(f"Download location: {download_path}\n")
 
-        # Restore original download path
-        self.download_path = original_path
+        total = len(video_info_list)
+        futures = []
+        skipped = 0
+        for info in video_info_list:
+            # Download all selected types with individual settings
+            types = [t for t in DOWNLOAD_TYPES if info[f"download_{t}"].get()]
+            if not types:
+                continue
+            settings = self.get_download_settings(
+                info["video_quality"],
+                info["video_codec"],
+                info["video_container"],
+                info["audio_format"],
+                info["audio_quality"],
+                info["subtitle_format"],
+                info["subtitle_language"],
+                download_path,
+                concurrent_fragments=info["concurrent_fragments"],
+                http_chunk_size=info["http_chunk_size"],
+                external_downloader=info["external_downloader"]
+            )
 
-        self.download_button.configure(state="normal")
-        self.log_message("\n" + "="*50)
-        self.log_message("All downloads completed!")
-        self.log_message("="*50 + "\n")
+            # Already downloaded with these settings - skipped before any yt-dlp run
+            remaining = self.engine.filter_archived(info["url"], types, settings)
+            if not remaining:
+                skipped += 1
+                continue
+            if len(remaining) < len(types):
+                self.log_message(f"Already downloaded: {', '.join(t for t in types if t not in remaining)} "
+                                 f"of {info['title']}")
+            futures.append(self.schedule_download(info["url"], info["title"], remaining, settings))
+
+        scheduler = self.engine.scheduler
+        self.log_message(f"Queued {len(futures)} download(s) - up to {scheduler.max_concurrent} at once, "
+                         f"{scheduler.per_host} per site")
+        if skipped:
+            self.log_message(f"Skipped {skipped} of {total} item(s) already in the download archive")
+        self.notify_when_done(futures, f"모든 다운로드가 완료되었습니다!\n총 {total}개의 동영상")
 
-        # Show completion notification
-        messagebox.showinfo(
-            self.lang.get("success_title") if "success_title" in self.lang.translations else "완료",
-            f"모든 다운로드가 완료되었습니다!\n총 {total}개의 동영상"
+    def download_single_with_types(self, url):
+        """Queue single URL with selected types on the download engine"""
+        selected = [
+            ("video", self.download_video_var),
+            ("audio", self.download_audio_var),
+            ("thumbnail", self.download_thumbnail_var),
+            ("subtitle", self.download_subtitle_var)
+        ]
+        types = [download_type for download_type, var in selected if var.get()]
+        settings = self.get_download_settings(
+            self.video_quality_var.get(),
+            self.video_codec_var.get(),
+            self.video_container_var.get(),
+            self.audio_format_var.get(),
+            self.audio_quality_var.get(),
+            self.subtitle_format_var.get(),
+            self.subtitle_language_var.get()
         )
 
-    def download_single_with_types(self, url):
-        """Download single URL with selected types"""
-        try:
-            # Download each selected type
-            if self.download_video_var.get():
-                self.log_message("Downloading video...")
-                self.download_video(url, download_type="video")
-
-            if self.download_audio_var.get():
-                self.log_message("Downloading audio...")
-                self.download_video(url, download_type="audio")
-
-            if self.download_thumbnail_var.get():
-                self.log_message("Downloading thumbnail...")
-                self.download_video(url, download_type="thumbnail")
-
-            if self.download_subtitle_var.get():
-                self.log_message(f"Downloading subtitle ({self.subtitle_format_var.get()}, {self.subtitle_language_var.get()})...")
-                self.download_video(
-                    url,
-                    download_type="subtitle",
-                    subtitle_format=self.subtitle_format_var.get(),
-                    subtitle_language=self.subtitle_language_var.get()
-                )
+        remaining = self.engine.filter_archived(url, types, settings)
+        if types and not remaining:
+            self.log_message("Skipped 1 of 1 item(s) already in the download archive")
+            messagebox.showinfo(self.lang.get("archived_title"), self.lang.get("archived_message"))
+            return
 
-        finally:
-            self.download_button.configure(state="normal")
+        cached = self.engine.video_analysis_cache.get(get_video_key(url))
+        future = self.schedule_download(url, cached["title"] if cached else url, remaining, settings)
+        self.notify_when_done([future], "다운로드가 완료되었습니다!")
 
-            # Show completion notification
-            messagebox.showinfo(
-                self.lang.get("success_title") if "success_title" in self.lang.translations else "완료",
-                "다운로드가 완료되었습니다!"
-            )
-
-    def download_multiple_videos(self, urls):
-        """Download multiple videos sequentially"""
-        total = len(urls)
-        for i, url in enumerate(urls, 1):
-            self.log_message(f"\n{'='*50}")
-            self.log_message(f"Downloading {i}/{total}: {url}")
-            self.log_message(f"{'='*50}\n")
-            self.download_video(url)
+    def resume_unfinished_jobs(self):
+        """Offer to resume the jobs that were queued or running when the app last stopped"""
+        jobs = self.engine.journal.unfinished()
+        if not jobs:
+            return
 
-        # Re-enable download button after all downloads
-        self.download_button.configure(state="normal")
+        if not messagebox.askyesno(self.lang.get("resume_title"), self.lang.get("resume_message", count=len(jobs))):
+            for job in jobs:
+                self.engine.journal.set_state(job["id"], "cancelled")
+            return
 
-        # Show completion notification
-        messagebox.showinfo(
-            self.lang.get("success_title") if "success_title" in self.lang.translations else "완료",
-            f"모든 다운로드가 완료되었습니다!\n총 {total}개의 동영상"
-        )
+        # Same output folder and settings, so yt-dlp continues from the .part files already on disk
+        self.log_message(f"Resuming {len(jobs)} unfinished download(s)")
+        futures = [
+            self.schedule_download(job["url"], job["title"], job["types"], job["settings"], journal_id=job["id"])
+            for job in jobs
+        ]
+        self.notify_when_done(futures, f"모든 다운로드가 완료되었습니다!\n총 {len(jobs)}개의 동영상")
 
     def get_height_from_quality(self, quality_text):
         """Extract height from quality text"""
@@ -2039,17 +2567,17 @@ class YouTubeDownloaderGUI:
             return "144"
         return None
 
-    def get_codec_filter(self, codec_text):
-        """Get codec filter string"""
+    def get_codec_key(self, codec_text):
+        """Get codec key (see VIDEO_CODECS), or None for any codec"""
         if self.lang.get("codec_av1") in codec_text or "AV1" in codec_text:
-            return "[vcodec^=av01]"
+            return "av1"
         elif self.lang.get("codec_vp9") in codec_text or "VP9" in codec_text:
-            return "[vcodec^=vp9]"
+            return "vp9"
         elif self.lang.get("codec_vp8") in codec_text or "VP8" in codec_text:
-            return "[vcodec^=vp8]"
+            return "vp8"
         elif self.lang.get("codec_avc") in codec_text or "AVC" in codec_text or "H.264" in codec_text:
-            return "[vcodec^=avc]"
-        return ""
+            return "avc"
+        return None
 
     def get_bitrate_from_text(self, bitrate_text):
         """Extract bitrate number from text"""
@@ -2061,208 +2589,22 @@ class YouTubeDownloaderGUI:
             return match.group(1)
         return None
 
-    def build_format_string(self):
-        """Build yt-dlp format string based on user selections"""
-        # Video format
-        video_selector = "bestvideo"
-
-        # Get quality
-        quality = self.video_quality_var.get()
-        height = self.get_height_from_quality(quality)
-
-        if height:
-            video_selector += f"[height<={height}]"
-
-        # Get codec
-        codec = self.video_codec_var.get()
-        codec_filter = self.get_codec_filter(codec)
-        if codec_filter:
-            video_selector += codec_filter
-
-        # Get audio bitrate
-        audio_quality = self.video_audio_quality_var.get()
-        audio_br = self.get_bitrate_from_text(audio_quality)
-
-        if audio_br:
-            format_string = f"{video_selector}+bestaudio[abr<={audio_br}]/best"
-        else:
-            format_string = f"{video_selector}+bestaudio/best"
-
-        return format_string
-
-    def download_video(self, url, download_type=None, video_quality=None, video_codec=None,
-                      video_container=None, audio_format=None, audio_quality=None, subtitle_format=None, subtitle_language=None):
-        try:
-            self.log_message(f"Starting download: {url}")
-            self.progress_label.configure(text=self.lang.get("downloading"))
-            self.progress_bar.set(0)
-
-            # Build yt-dlp command
-            output_template = os.path.join(self.download_path, "%(title)s.%(ext)s")
-
-            cmd = self.get_ytdlp_command() + [url, "-o", output_template]
-
-            # Add cookie options if enabled
-            if self.use_cookies_var.get():
-                browser = self.browser_var.get()
-                profile = self.profile_var.get()
-                if browser and browser != self.lang.get("no_browsers_found"):
-                    browser_profile = f"{browser}:{profile}" if profile and profile != "Default" else browser
-                    cmd.extend(["--cookies-from-browser", browser_profile])
-                    self.log_message(f"Using cookies from: {browser_profile}")
-
-            # Determine download type
-            if download_type is None:
-                # Use checkbox settings if no type specified
-                if self.download_thumbnail_var.get():
-                    download_type = "thumbnail"
-                elif self.download_audio_var.get():
-                    download_type = "audio"
-                elif self.download_video_var.get():
-                    download_type = "video"
-                else:
-                    download_type = "video"  # Default
-
-            # Use provided settings or fall back to global settings
-            _audio_format = audio_format if audio_format is not None else self.audio_format_var.get()
-            _audio_quality = audio_quality if audio_quality is not None else self.audio_quality_var.get()
-            _video_quality = video_quality if video_quality is not None else self.video_quality_var.get()
-            _video_codec = video_codec if video_codec is not None else self.video_codec_var.get()
-            _video_container = video_container if video_container is not None else self.video_container_var.get()
-            _subtitle_format = subtitle_format if subtitle_format is not None else "srt"
-            _subtitle_language = subtitle_language if subtitle_language is not None else "en"
-
-            # Add format options
-            if download_type == "subtitle":
-                # Subtitle download
-                cmd.extend(["--write-subs", "--write-auto-subs", "--skip-download"])
-                cmd.extend(["--sub-format", _subtitle_format])
-                cmd.extend(["--convert-subs", _subtitle_format])
-                cmd.extend(["--sub-langs", _subtitle_language])
-                self.log_message(f"Format: Subtitle ({_subtitle_format}, language: {_subtitle_language})")
-
-            elif download_type == "thumbnail":
-                # Thumbnail only download
-                cmd.extend(["--write-thumbnail", "--skip-download"])
-                self.log_message(f"Format: Thumbnail only")
-
-            elif download_type == "audio":
-                # Audio download
-                if _audio_format == self.lang.get("custom_format"):
-                    _audio_format = self.custom_audio_entry.get().strip() or "mp3"
-
-                cmd.extend(["-x", "--audio-format", _audio_format])
-
-                bitrate = self.get_bitrate_from_text(_audio_quality)
-                if bitrate:
-                    cmd.extend(["--audio-quality", bitrate + "K"])
-
-                self.log_message(f"Format: Audio only")
-                self.log_message(f"Audio Format: {_audio_format.upper()}")
-                self.log_message(f"Audio Quality: {_audio_quality}")
-
-            else:
-                # Video download - build format string with individual settings
-                video_selector = "bestvideo"
-
-                # Get quality
-                height = self.get_height_from_quality(_video_quality)
-                if height:
-                    video_selector += f"[height<={height}]"
-
-                # Get codec
-                codec_filter = self.get_codec_filter(_video_codec)
-                if codec_filter:
-                    video_selector += codec_filter
-
-                # Get audio bitrate
-                audio_br = self.get_bitrate_from_text(_audio_quality)
-                if audio_br:
-                    format_string = f"{video_selector}+bestaudio[abr<={audio_br}]/best"
-                else:
-                    format_string = f"{video_selector}+bestaudio/best"
-
-                cmd.extend(["-f", format_string])
-
-                # Set container format
-                container = _video_container
-                if container == self.lang.get("custom_format"):
-                    container = self.custom_container_entry.get().strip() or "mp4"
-
-                cmd.extend(["--merge-output-format", container])
-                # Add remux to ensure format conversion if needed
-                cmd.extend(["--remux-video", container])
-
-                # Log settings
-                self.log_message(f"Format: Video")
-                self.log_message(f"Quality: {_video_quality}")
-                self.log_message(f"Video Codec: {_video_codec}")
-                self.log_message(f"Audio Bitrate: {_audio_quality}")
-                self.log_message(f"Container: {container.upper()}")
-
-            # Add embed options (for video and audio only, not for thumbnail-only mode)
-            if download_type != "thumbnail":
-                if self.embed_thumbnail_var.get():
-                    cmd.extend(["--embed-thumbnail"])
-                    self.log_message("Embedding thumbnail")
-
-                if self.embed_metadata_var.get():
-                    cmd.extend(["--embed-metadata"])
-                    self.log_message("Embedding metadata")
-
-            # Add progress and other options
-            cmd.extend(["--newline", "--no-playlist"])
-
-            self.log_message(f"Download location: {self.download_path}")
-            self.log_message("Processing...")
-            self.log_message(f"Command: {' '.join(cmd)}")
-
-            # Execute command
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1
-            )
-
-            # Read output
-            for line in process.stdout:
-                line = line.strip()
-                if line:
-                    # Parse progress
-                    if "%" in line and "ETA" in line:
-                        try:
-                            percent_str = line.split("%")[0].split()[-1]
-                            percent = float(percent_str) / 100
-                            self.progress_bar.set(percent)
-                        except:
-                            pass
-                    self.log_message(line)
-
-            process.wait()
-
-            if process.returncode == 0:
-                self.progress_bar.set(1.0)
-                self.progress_label.configure(text=self.lang.get("download_completed"))
-                self.log_message("Download completed successfully!")
-                return True
-            else:
-                self.progress_label.configure(text=self.lang.get("download_failed"))
-                self.log_message("Download failed!")
-                return False
-
-        except Exception as e:
-            self.log_message(f"Error: {str(e)}")
-            self.progress_label.configure(text=self.lang.get("error_occurred"))
-            return False
-
     def run(self):
         self.window.mainloop()
+        if self.control_server is not None:
+            self.control_server.stop()
+        # Write lines queued after the last flush to the log file
+        self.log_pipeline.drain()
+        self.log_pipeline.close()
 
 
 def main():
-    app = YouTubeDownloaderGUI()
+    # --headless downloads a URL list with the same engine and settings, without creating a window
+    if "--headless" in sys.argv[1:]:
+        sys.exit(run_headless([arg for arg in sys.argv[1:] if arg != "--headless"]))
+
+    # --startup-profile prints the time to first paint per startup phase and exits
+    app = YouTubeDownloaderGUI(startup_profile="--startup-profile" in sys.argv[1:])
     app.run()
 
 